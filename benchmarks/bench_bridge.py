@@ -0,0 +1,104 @@
+"""Benchmark the standalone bridge: main.on_message -> publish_ha_discovery.
+
+A fake `config` module is injected before main.py is imported and the MQTT
+client is replaced with one that only counts publishes, so nothing connects
+anywhere. The first uplink of every device publishes its discovery configs;
+later rounds measure the steady state where discovery is unchanged.
+
+    python benchmarks/bench_bridge.py --devices 10000 --rounds 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import types
+
+import paho.mqtt.client as mqtt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common import PeakMemory, make_messages, measure  # noqa: E402
+from fleet import Fleet, FleetSpec  # noqa: E402
+
+
+class FakeMqttClient:
+    def __init__(self):
+        self.published = 0
+        self.published_bytes = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.published += 1
+        self.published_bytes += len(payload or "")
+        return mqtt.MQTTMessageInfo(self.published)
+
+
+def install_config(args, cache_path):
+    cfg = types.SimpleNamespace(
+        LOG_LEVEL="WARNING",
+        MQTT_BROKER_HOST="127.0.0.1",
+        MQTT_BROKER_PORT=1883,
+        MQTT_USERNAME=None,
+        MQTT_PASSWORD=None,
+        CHIRPSTACK_UPLINK_TOPIC="application/+/device/+/event/up",
+        HA_DISCOVERY_PREFIX="homeassistant",
+        DISCOVERY_CACHE_PATH=cache_path,
+    )
+    module = types.ModuleType("config")
+    module.get_config = lambda: cfg
+    sys.modules["config"] = module
+
+
+def reset_bridge(main, cache_path):
+    """Give the bridge an empty discovery cache and a fresh fake client."""
+    from discovery_cache import DiscoveryCache
+
+    main.published_discovery.close()
+    main.published_discovery = DiscoveryCache(cache_path)
+    main.mqtt_client = FakeMqttClient()
+
+
+def main_benchmark(args):
+    workdir = tempfile.mkdtemp(prefix="bench_bridge_")
+    install_config(args, os.path.join(workdir, "warmup.sqlite3"))
+    try:
+        import main
+    except ImportError as e:
+        print(f"Skipping bridge benchmark: {e}")
+        return 0
+    spec = FleetSpec.from_args(args)
+    fleet = Fleet(spec)
+    first = make_messages(fleet, spec.devices)
+    steady = make_messages(fleet, spec.devices * (args.rounds - 1))
+    print(f"Fleet: {spec}")
+
+    def handle(message):
+        main.on_message(None, None, message)
+
+    reset_bridge(main, os.path.join(workdir, "timed.sqlite3"))
+    results = [measure("first uplink", first, handle)]
+    client = main.mqtt_client
+    if steady:
+        results.append(measure("steady state", steady, handle))
+    for result in results:
+        print(result.report())
+    print(f"discovery publishes: {client.published} ({client.published_bytes / 2**20:.1f} MiB)")
+
+    reset_bridge(main, os.path.join(workdir, "memory.sqlite3"))
+    with PeakMemory() as memory:
+        for message in first + steady:
+            handle(message)
+    print(memory.report("all rounds"))
+    main.published_discovery.close()
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    FleetSpec.add_arguments(parser)
+    parser.add_argument("--rounds", type=int, default=3, help="uplinks per device")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main_benchmark(parse_args()))
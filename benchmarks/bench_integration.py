@@ -0,0 +1,230 @@
+"""Benchmark the integration: UplinkDispatcher.async_message_received -> scheduler -> platform handle_event.
+
+Runs the real platform setup functions against a minimal fake `hass`:
+entities get an entity_id when added and state writes are only counted, the
+entity registry starts empty and InfluxDB is replaced with a client that
+drops writes. Home Assistant itself must be installed; the benchmark skips
+otherwise.
+
+The first uplink of every device is submitted as one burst and the latency
+of each uplink is the time from the start of the burst until it is processed
+(entity creation waits on purpose); later rounds are submitted and waited
+for one by one to measure per-message cost.
+
+    python benchmarks/bench_integration.py --devices 10000 --rounds 3 --history 10
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common import PeakMemory, Result, async_measure, make_messages  # noqa: E402
+from fleet import Fleet, FleetSpec  # noqa: E402
+
+PLATFORMS = ("sensor", "button", "number", "select", "switch", "text")
+
+
+class FakeBus:
+    def async_listen(self, event_type, listener):
+        return lambda: None
+
+    def async_listen_once(self, event_type, listener):
+        return lambda: None
+
+
+class FakeHass:
+    """Just enough of HomeAssistant for the integration's uplink path."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.data = {}
+        self.bus = FakeBus()
+        self.is_running = True
+        self.state_writes = 0
+
+    def async_create_task(self, target, name=None, eager_start=False):
+        return self.loop.create_task(target)
+
+    def async_create_background_task(self, target, name, eager_start=False):
+        return self.loop.create_task(target)
+
+    async def async_add_executor_job(self, target, *args):
+        return await self.loop.run_in_executor(None, target, *args)
+
+    def _count_state_write(self):
+        self.state_writes += 1
+
+    def add_entities_callback(self, domain, platform, entry_id):
+        entity_index = self.data[domain]["entity_index"]
+
+        def async_add_entities(entities, update_before_add=False):
+            for entity in entities:
+                entity.hass = self
+                entity.entity_id = f"{platform}.{entity.unique_id}"
+                entity.async_write_ha_state = self._count_state_write
+                # What the entity registry update event would tell the index
+                entity_index._async_add(SimpleNamespace(
+                    platform=domain,
+                    config_entry_id=entry_id,
+                    domain=platform,
+                    unique_id=entity.unique_id,
+                    entity_id=entity.entity_id,
+                ))
+
+        return async_add_entities
+
+
+class FakeWriteApi:
+    def __init__(self):
+        self.points = 0
+
+    def write(self, bucket, org=None, record=None, write_precision=None):
+        if isinstance(record, (bytes, bytearray)):
+            self.points += record.count(b"\n")
+
+    def close(self):
+        pass
+
+
+class FakeInfluxClient:
+    def __init__(self, *args, **kwargs):
+        self.write_api_instance = FakeWriteApi()
+
+    def write_api(self, write_options=None):
+        return self.write_api_instance
+
+    def query_api(self):
+        return SimpleNamespace(query=lambda *args, **kwargs: [])
+
+    def close(self):
+        pass
+
+
+def create_fake_influx_client(url, token, org):
+    client = FakeInfluxClient()
+    return client, client.write_api()
+
+
+async def async_setup_integration(hass, influx, create_client=create_fake_influx_client):
+    """Set up one config entry the way __init__.async_setup_entry would, minus MQTT."""
+    from homeassistant.helpers import entity_registry as er
+    from custom_components.chirpstack_ha import const
+    from custom_components.chirpstack_ha import button, number, select, sensor, switch, text
+    from custom_components.chirpstack_ha.dispatcher import UplinkDispatcher
+    from custom_components.chirpstack_ha.entity_index import EntityIndex
+    from custom_components.chirpstack_ha.metrics import Metrics
+    from custom_components.chirpstack_ha.runtime_config import async_update_runtime_config
+
+    # An empty registry, and by default an InfluxDB that accepts everything
+    er.async_get = lambda hass: SimpleNamespace(entities={})
+    sensor.create_influxdb_client = create_client
+    entry_data = {"version": "2.x", "host": "localhost", "port": 8086}
+    if influx:
+        entry_data.update(bucket="bench", org="bench", token="bench")
+    entry = SimpleNamespace(entry_id="bench", data=entry_data)
+    domain = const.DOMAIN
+    metrics = Metrics()
+    hass.data[domain] = {"metrics": metrics, "dispatcher": UplinkDispatcher(hass, metrics), "entity_index": EntityIndex(hass)}
+    hass.data[domain]["entity_index"].async_start()
+    hass.data[domain][entry.entry_id] = entry.data
+    async_update_runtime_config(hass, entry.entry_id, entry.data)
+    modules = dict(sensor=sensor, button=button, number=number, select=select, switch=switch, text=text)
+    for platform in PLATFORMS:
+        await modules[platform].async_setup_entry(hass, entry, hass.add_entities_callback(domain, platform, entry.entry_id))
+    return hass.data[domain]
+
+
+async def async_measure_burst(name, messages, dispatcher):
+    """Submit all messages at once and time each uplink from the start of the burst until processed."""
+    latencies = []
+    clock = time.perf_counter
+    dispatch = dispatcher.async_dispatch
+
+    async def timed_dispatch(uplink):
+        await dispatch(uplink)
+        latencies.append(clock() - start)
+
+    dispatcher.async_dispatch = timed_dispatch
+    gc.collect()
+    start = clock()
+    for message in messages:
+        dispatcher.async_message_received(message)
+    await dispatcher.scheduler.async_wait_idle()
+    elapsed = clock() - start
+    del dispatcher.async_dispatch
+    return Result(name, latencies, elapsed)
+
+
+def processed(dispatcher):
+    async def handle(message):
+        dispatcher.async_message_received(message)
+        await dispatcher.scheduler.async_wait_idle()
+
+    return handle
+
+
+async def async_teardown(domain_data):
+    for writer in domain_data.get("influxdb_writers", {}).values():
+        await writer.async_stop()
+
+
+async def async_benchmark(args):
+    try:
+        import homeassistant  # noqa: F401
+    except ImportError as e:
+        print(f"Skipping integration benchmark: {e}")
+        return 0
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("custom_components.chirpstack_ha").setLevel(logging.WARNING)
+    spec = FleetSpec.from_args(args)
+    fleet = Fleet(spec)
+    first = make_messages(fleet, spec.devices)
+    steady = make_messages(fleet, spec.devices * (args.rounds - 1))
+    print(f"Fleet: {spec}")
+    loop = asyncio.get_running_loop()
+
+    hass = FakeHass(loop)
+    domain_data = await async_setup_integration(hass, not args.no_influx)
+    dispatcher = domain_data["dispatcher"]
+    results = [await async_measure_burst("first uplink (burst)", first, dispatcher)]
+    if steady:
+        results.append(await async_measure("steady state", steady, processed(dispatcher)))
+    await async_teardown(domain_data)
+    for result in results:
+        print(result.report())
+    print(f"state writes: {hass.state_writes}")
+    for writer in domain_data.get("influxdb_writers", {}).values():
+        print(f"influx points written: {writer.written}, dropped: {writer.dropped}")
+
+    hass = FakeHass(loop)
+    with PeakMemory() as memory:
+        domain_data = await async_setup_integration(hass, not args.no_influx)
+        dispatcher = domain_data["dispatcher"]
+        for message in first:
+            dispatcher.async_message_received(message)
+        await dispatcher.scheduler.async_wait_idle()
+        handle = processed(dispatcher)
+        for message in steady:
+            await handle(message)
+        await async_teardown(domain_data)
+    print(memory.report("all rounds"))
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    FleetSpec.add_arguments(parser)
+    parser.add_argument("--rounds", type=int, default=3, help="uplinks per device")
+    parser.add_argument("--no-influx", action="store_true", help="run without the (fake) InfluxDB writer")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(async_benchmark(parse_args())))
@@ -0,0 +1,136 @@
+"""Benchmark the integration's contribution to Home Assistant startup.
+
+Every run starts a fresh interpreter that first imports the parts of Home
+Assistant a bootstrap has already loaded by the time it reaches this
+integration (core, the entity platforms and MQTT), then measures:
+
+- import: importing the integration package and its platform modules, and
+  which top-level packages that pulled in;
+- setup: setting up one config entry on the benchmark's fake `hass` (see
+  bench_integration.py) once the integration is imported, without InfluxDB
+  and with an InfluxDB sink whose client library is imported for real but
+  never queried.
+
+Home Assistant must be installed; the benchmark skips otherwise.
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Loaded by Home Assistant before it imports the integration; not counted
+BASELINE = (
+    "homeassistant.core",
+    "homeassistant.config_entries",
+    "homeassistant.helpers.entity_registry",
+    "homeassistant.helpers.event",
+    "homeassistant.components.mqtt",
+    "homeassistant.components.sensor",
+    "homeassistant.components.button",
+    "homeassistant.components.number",
+    "homeassistant.components.select",
+    "homeassistant.components.switch",
+    "homeassistant.components.text",
+)
+INTEGRATION = "custom_components.chirpstack_ha"
+MODULES = (INTEGRATION, *(f"{INTEGRATION}.{platform}" for platform in ("sensor", "button", "number", "select", "switch", "text")))
+# Optional dependencies that should only load once an InfluxDB sink is configured
+HEAVY = ("influxdb_client", "numpy")
+
+
+def top_level(modules):
+    return {name.split(".", 1)[0] for name in modules}
+
+
+def child_import():
+    import importlib
+
+    for name in BASELINE:
+        importlib.import_module(name)
+    before = set(sys.modules)
+    start = time.perf_counter()
+    for name in MODULES:
+        importlib.import_module(name)
+    elapsed = time.perf_counter() - start
+    added = sorted(top_level(set(sys.modules) - before) - top_level(before) - {"custom_components"})
+    return {"seconds": elapsed, "packages": added}
+
+
+async def async_child_setup(influx):
+    import importlib
+
+    for name in BASELINE:
+        importlib.import_module(name)
+    from bench_integration import FakeHass, async_setup_integration, async_teardown
+    from custom_components.chirpstack_ha import sensor
+
+    async def no_last_values(*args, **kwargs):
+        return {}
+
+    # Import the real client library, but keep the warm-up query off the network
+    real_create = sensor.create_influxdb_client
+    sensor.get_last_influxdb_values = no_last_values
+    before = set(sys.modules)
+    hass = FakeHass(asyncio.get_running_loop())
+    start = time.perf_counter()
+    domain_data = await async_setup_integration(hass, influx, create_client=real_create)
+    elapsed = time.perf_counter() - start
+    await async_teardown(domain_data)
+    added = sorted(top_level(set(sys.modules) - before) - top_level(before))
+    return {"seconds": elapsed, "packages": added}
+
+
+def run_child(mode):
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode]
+    output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=ROOT).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def report(label, results):
+    seconds = sorted(result["seconds"] for result in results)
+    median = statistics.median(seconds) * 1000
+    loaded = set().union(*(result["packages"] for result in results))
+    heavy = [name for name in HEAVY if name in loaded]
+    print(f"{label:<24} median {median:8.1f} ms  min {seconds[0] * 1000:8.1f} ms  max {seconds[-1] * 1000:8.1f} ms")
+    print(f"{'':<24} new packages: {', '.join(sorted(loaded)) or '-'}")
+    if heavy:
+        print(f"{'':<24} heavy optional packages loaded: {', '.join(heavy)}")
+
+
+def main(args):
+    if args.child:
+        if args.child == "import":
+            result = child_import()
+        else:
+            result = asyncio.run(async_child_setup(args.child == "setup-influx"))
+        print(json.dumps(result))
+        return 0
+    try:
+        import homeassistant  # noqa: F401
+    except ImportError as e:
+        print(f"Skipping startup benchmark: {e}")
+        return 0
+    print(f"Runs: {args.runs}, each in a fresh interpreter")
+    for mode, label in (("import", "import"), ("setup", "setup (no InfluxDB)"), ("setup-influx", "setup (InfluxDB)")):
+        report(label, [run_child(mode) for _ in range(args.runs)])
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--child", choices=("import", "setup", "setup-influx"), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
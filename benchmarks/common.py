@@ -0,0 +1,96 @@
+"""Timing and reporting shared by the benchmarks."""
+import gc
+import time
+import tracemalloc
+
+
+class Message:
+    """Stand-in for an MQTT message (paho's MQTTMessage / HA's ReceiveMessage)."""
+
+    __slots__ = ("topic", "payload", "qos", "retain")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+        self.qos = 0
+        self.retain = False
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Result:
+    def __init__(self, name, latencies, elapsed):
+        self.name = name
+        self.count = len(latencies)
+        self.elapsed = elapsed
+        latencies = sorted(latencies)
+        self.p50 = percentile(latencies, 0.50)
+        self.p99 = percentile(latencies, 0.99)
+
+    @property
+    def rate(self):
+        return self.count / self.elapsed if self.elapsed else 0.0
+
+    def report(self):
+        return (
+            f"{self.name}: {self.count} msgs in {self.elapsed:.2f}s = {self.rate:,.0f} msgs/s, "
+            f"p50 {self.p50 * 1e6:.1f}us, p99 {self.p99 * 1e6:.1f}us"
+        )
+
+
+def make_messages(fleet, count):
+    """Generate messages up front so payload generation is not measured."""
+    return [Message(topic, payload) for topic, payload in fleet.uplinks(count)]
+
+
+def measure(name, messages, handle):
+    """Call handle(message) for every message and time each call."""
+    latencies = []
+    gc.collect()
+    clock = time.perf_counter
+    start = clock()
+    for message in messages:
+        t0 = clock()
+        handle(message)
+        latencies.append(clock() - t0)
+    return Result(name, latencies, clock() - start)
+
+
+async def async_measure(name, messages, handle):
+    """measure() for a coroutine handler."""
+    latencies = []
+    gc.collect()
+    clock = time.perf_counter
+    start = clock()
+    for message in messages:
+        t0 = clock()
+        await handle(message)
+        latencies.append(clock() - t0)
+    return Result(name, latencies, clock() - start)
+
+
+class PeakMemory:
+    """Peak traced memory allocated inside the block, in bytes.
+
+    tracemalloc slows allocation down, so run it on a separate pass from the
+    timed one.
+    """
+
+    def __enter__(self):
+        gc.collect()
+        tracemalloc.start()
+        self.peak = 0
+        return self
+
+    def __exit__(self, *exc_info):
+        _, self.peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    def report(self, name):
+        return f"{name}: peak memory {self.peak / 2**20:.1f} MiB"
+
@@ -0,0 +1,130 @@
+"""Synthetic ChirpStack fleet: deterministic uplink events for load generation."""
+import json
+import random
+import time
+from dataclasses import dataclass
+
+SENSOR_KINDS = (
+    ("temperature", "°C", "temperature"),
+    ("humidity", "%", "humidity"),
+    ("battery", "%", "battery"),
+    ("pressure", "hPa", "pressure"),
+    ("co2", "ppm", "carbon_dioxide"),
+    ("illuminance", "lx", "illuminance"),
+)
+COMMAND_TYPES = ("switch", "number", "button", "select", "text")
+
+
+@dataclass
+class FleetSpec:
+    devices: int = 10_000
+    fields: int = 4
+    commands: int = 2
+    # History entries carried by every uplink (0 for live-only uplinks)
+    history: int = 0
+    # Probability that an uplink carries a changed discovery block
+    churn: float = 0.0
+    seed: int = 1
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument("--devices", type=int, default=cls.devices)
+        parser.add_argument("--fields", type=int, default=cls.fields)
+        parser.add_argument("--commands", type=int, default=cls.commands)
+        parser.add_argument("--history", type=int, default=cls.history)
+        parser.add_argument("--churn", type=float, default=cls.churn)
+        parser.add_argument("--seed", type=int, default=cls.seed)
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.devices, args.fields, args.commands, args.history, args.churn, args.seed)
+
+
+class Fleet:
+    """Generates uplinks round-robin over the fleet, as (topic, payload bytes)."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self._random = random.Random(spec.seed)
+        self._revisions = [0] * spec.devices
+        self._f_cnt = [0] * spec.devices
+        self._discovery = {}
+
+    @staticmethod
+    def dev_eui(index):
+        return f"{index:016x}"
+
+    def discovery(self, revision):
+        """Discovery block shared by all devices at the same revision."""
+        cached = self._discovery.get(revision)
+        if cached is not None:
+            return cached
+        suffix = f" r{revision}" if revision else ""
+        sensors = []
+        for i in range(self.spec.fields):
+            kind, unit, device_class = SENSOR_KINDS[i % len(SENSOR_KINDS)]
+            sensors.append({"field": f"{kind}_{i}", "name": f"{kind.title()} {i}{suffix}", "unit": unit, "device_class": device_class, "precision": 1})
+        commands = []
+        for i in range(self.spec.commands):
+            kind = COMMAND_TYPES[i % len(COMMAND_TYPES)]
+            command = {"field": f"{kind}_{i}", "name": f"{kind.title()} {i}{suffix}", "type": kind}
+            if kind == "number":
+                command.update(min=0, max=100, step=1)
+            elif kind == "select":
+                command["options"] = ["low", "medium", "high"]
+            commands.append(command)
+        self._discovery[revision] = {"sensors": sensors, "commands": commands}
+        return self._discovery[revision]
+
+    def event(self, index):
+        spec = self.spec
+        rand = self._random
+        if spec.churn and rand.random() < spec.churn:
+            self._revisions[index] += 1
+        self._f_cnt[index] += 1
+        now = time.time()
+        discovery = self.discovery(self._revisions[index])
+        values = {sensor["field"]: round(rand.uniform(0, 100), 1) for sensor in discovery["sensors"]}
+        obj = dict(values, discovery=discovery)
+        if spec.history:
+            obj["history"] = [
+                dict({field: round(value + rand.uniform(-1, 1), 1) for field, value in values.items()}, timestamp=int(now) - 60 * (spec.history - i))
+                for i in range(spec.history)
+            ]
+        dev_eui = self.dev_eui(index)
+        return {
+            "deduplicationId": f"{index:08x}-{self._f_cnt[index]:08x}",
+            "time": now,
+            "deviceInfo": {
+                "tenantId": "52f14cd4-c6f1-4fbd-8f87-4025e1d49242",
+                "tenantName": "Bench",
+                "applicationId": "1",
+                "applicationName": "bench",
+                "deviceProfileId": "0b46400d-2f5b-4af4-8c27-a0e1a4aa8b2f",
+                "deviceProfileName": "bench-profile",
+                "deviceName": f"device-{index}",
+                "devEui": dev_eui,
+            },
+            "devAddr": f"{index & 0xFFFFFFFF:08x}",
+            "adr": True,
+            "dr": 5,
+            "fCnt": self._f_cnt[index],
+            "fPort": 2,
+            "confirmed": False,
+            "data": "AQIDBAUGBwgJCg==",
+            "object": obj,
+            "rxInfo": [
+                {"gatewayId": f"{g:016x}", "uplinkId": rand.randrange(1 << 16), "rssi": -rand.randrange(40, 120), "snr": round(rand.uniform(-10, 10), 1), "channel": g, "location": {"latitude": 52.0, "longitude": 4.0}, "context": "AAAAAA==", "metadata": {"region_config_id": "eu868"}}
+                for g in range(2)
+            ],
+            "txInfo": {"frequency": 868100000, "modulation": {"lora": {"bandwidth": 125000, "spreadingFactor": 7, "codeRate": "CR_4_5"}}},
+        }
+
+    def uplink(self, index):
+        topic = f"application/1/device/{self.dev_eui(index)}/event/up"
+        return topic, json.dumps(self.event(index)).encode()
+
+    def uplinks(self, count):
+        devices = self.spec.devices
+        for n in range(count):
+            yield self.uplink(n % devices)
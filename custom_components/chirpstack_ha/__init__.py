@@ -1,12 +1,16 @@
 import logging
-import json
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.components import mqtt
 from homeassistant.const import EVENT_HOMEASSISTANT_STARTED
 from homeassistant.exceptions import HomeAssistantError
-
-print("LOADING CHIRPSTACK_HA FROM", __file__)
+from .const import SHUTDOWN_TIMEOUT
+from .discovery_store import DiscoveryStore
+from .dispatcher import UplinkDispatcher
+from .downlink import DownlinkScheduler
+from .entity_index import EntityIndex
+from .metrics import Metrics
+from .runtime_config import async_remove_runtime_config, async_update_runtime_config
 
 DOMAIN = "chirpstack_ha"
 _LOGGER = logging.getLogger(__name__)
@@ -21,9 +25,31 @@ async def async_setup_entry(hass, entry):
     _LOGGER.debug("ChirpStack HA async_setup_entry called")
     # Set up shared data for callbacks
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN].setdefault("entity_callbacks", [])
+    # Pipeline counters and latency histograms, shared by all entries
+    metrics = hass.data[DOMAIN].setdefault("metrics", Metrics())
+    if "dispatcher" not in hass.data[DOMAIN]:
+        hass.data[DOMAIN]["dispatcher"] = UplinkDispatcher(hass, metrics)
+    dispatcher = hass.data[DOMAIN]["dispatcher"]
+    if "discovery_store" not in hass.data[DOMAIN]:
+        # Loaded before the platforms, which restore their entities from it
+        discovery_store = DiscoveryStore(hass)
+        await discovery_store.async_load()
+        hass.data[DOMAIN]["discovery_store"] = discovery_store
+    dispatcher.discovery_store = hass.data[DOMAIN]["discovery_store"]
+    if "downlinks" not in hass.data[DOMAIN]:
+        downlinks = DownlinkScheduler(hass, metrics=metrics)
+        # Commands to known devices need not wait for their next uplink
+        for dev_eui, application_id in dispatcher.discovery_store.application_ids():
+            downlinks.async_uplink_received(dev_eui, application_id)
+        hass.data[DOMAIN]["downlinks"] = downlinks
+    dispatcher.downlinks = hass.data[DOMAIN]["downlinks"]
+    if "entity_index" not in hass.data[DOMAIN]:
+        entity_index = EntityIndex(hass)
+        entity_index.async_start()
+        hass.data[DOMAIN]["entity_index"] = entity_index
     # Store config entry data for platform access
     hass.data[DOMAIN][entry.entry_id] = entry.data
+    async_update_runtime_config(hass, entry.entry_id, entry.data)
 
     def notify_mqtt_required(_event=None):
         hass.async_create_task(
@@ -81,21 +107,12 @@ async def async_setup_entry(hass, entry):
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
-    async def message_received(msg):
-        _LOGGER.debug("Received MQTT message: %s", msg.payload)
-        try:
-            event = json.loads(msg.payload)
-            _LOGGER.debug("Parsed event: %s", event)
-            # Notify all registered entity callbacks
-            for cb in hass.data[DOMAIN]["entity_callbacks"]:
-                await cb(event)
-        except Exception as e:
-            _LOGGER.exception("Error processing ChirpStack MQTT message: %s", e)
-
-    async def subscribe_mqtt(_event):
+    async def subscribe_mqtt(_event=None):
+        if dispatcher.subscribed:
+            return
         _LOGGER.debug("Home Assistant started, subscribing to MQTT topic")
         try:
-            await mqtt.async_subscribe(hass, "application/+/device/+/event/up", message_received)
+            await dispatcher.async_subscribe(mqtt)
             _LOGGER.info("ChirpStack HA integration initialized and subscribed to MQTT.")
         except Exception as e:
             _LOGGER.error("Failed to subscribe to MQTT topic: %s", e)
@@ -112,7 +129,10 @@ async def async_setup_entry(hass, entry):
                 )
             )
 
-    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STARTED, subscribe_mqtt)
+    if hass.is_running:
+        await subscribe_mqtt()
+    else:
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STARTED, subscribe_mqtt)
     _LOGGER.debug("ChirpStack HA async_setup_entry exiting (waiting for Home Assistant start)")
     return True
 
@@ -123,6 +143,28 @@ async def async_unload_entry(hass, entry):
         # Clean up config entry data
         if entry.entry_id in hass.data.get(DOMAIN, {}):
             hass.data[DOMAIN].pop(entry.entry_id)
+        async_remove_runtime_config(hass, entry.entry_id)
+        # Drain queued InfluxDB points before the client goes away
+        writer = hass.data.get(DOMAIN, {}).get("influxdb_writers", {}).pop(entry.entry_id, None)
+        if writer is not None:
+            await writer.async_stop()
+        # Drop the shared MQTT subscription once no entry is listening
+        dispatcher = hass.data.get(DOMAIN, {}).get("dispatcher")
+        if dispatcher is not None:
+            dispatcher.async_unregister_entry(entry.entry_id)
+        if dispatcher is not None and not dispatcher.has_handlers:
+            dispatcher.async_unsubscribe()
+            hass.data[DOMAIN].pop("dispatcher")
+            await dispatcher.scheduler.async_stop(SHUTDOWN_TIMEOUT)
+            entity_index = hass.data[DOMAIN].pop("entity_index", None)
+            if entity_index is not None:
+                entity_index.async_stop()
+            downlinks = hass.data[DOMAIN].pop("downlinks", None)
+            if downlinks is not None:
+                await downlinks.async_stop()
+            discovery_store = hass.data[DOMAIN].pop("discovery_store", None)
+            if discovery_store is not None:
+                await discovery_store.async_stop()
     return unload_ok
 
 async def async_reload_entry(hass, entry):
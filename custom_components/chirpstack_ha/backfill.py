@@ -0,0 +1,138 @@
+from array import array
+
+# NumPy is optional and slow to import; it is loaded on first use, see load_numpy()
+np = None
+_numpy_loaded = False
+
+DEFAULT_EPSILON = 1e-6
+
+
+def load_numpy():
+    """Import NumPy if it is installed, falling back to the stdlib array module."""
+    global np, _numpy_loaded
+    if not _numpy_loaded:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        np = numpy
+        _numpy_loaded = True
+    return np
+
+
+def normalize(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def transpose_history(history, fields):
+    """Transpose history entries into {field: (timestamps, values)} columns in one pass.
+
+    Entries without a timestamp are skipped, as are fields not in `fields`.
+    """
+    columns = {field: ([], []) for field in fields}
+    for entry in history:
+        ts = entry.get("timestamp")
+        if ts is None:
+            continue
+        for field, value in entry.items():
+            column = columns.get(field)
+            if column is not None:
+                column[0].append(ts)
+                column[1].append(value)
+    return columns
+
+
+def _to_floats(values):
+    """Return values as a float vector, or None if any value is not numeric."""
+    try:
+        if np is not None:
+            return np.fromiter(map(float, values), dtype=float, count=len(values))
+        return array("d", map(float, values))
+    except (TypeError, ValueError):
+        return None
+
+
+def _changed_mask(floats, seed, epsilon):
+    """Mask of values that differ by more than epsilon from the last value kept before them.
+
+    The seed is the last value kept before the first one. If no value differs
+    from its predecessor by a nonzero amount within epsilon, every dropped
+    value equals the last kept one, so comparing neighbours gives the same
+    mask in one vectorized pass; otherwise the values are walked in order.
+    """
+    seeded = isinstance(seed, float)
+    if np is not None:
+        diffs = np.abs(np.diff(floats, prepend=seed)) if seeded else np.abs(np.diff(floats))
+        if not np.any((diffs > 0) & (diffs <= epsilon)):
+            if seeded:
+                return diffs > epsilon
+            mask = np.empty(len(floats), dtype=bool)
+            mask[0] = True
+            np.greater(diffs, epsilon, out=mask[1:])
+            return mask
+    else:
+        pairs = zip([seed, *floats[:-1]], floats) if seeded else zip(floats, floats[1:])
+        diffs = [abs(b - a) for a, b in pairs]
+        if not any(0 < diff <= epsilon for diff in diffs):
+            mask = [] if seeded else [True]
+            mask.extend(diff > epsilon for diff in diffs)
+            return mask
+    mask = []
+    last = seed if seeded else None
+    for value in floats:
+        changed = last is None or abs(value - last) > epsilon
+        mask.append(changed)
+        if changed:
+            last = value
+    return mask
+
+
+def _changes_scalar(timestamps, values, seed, epsilon):
+    # Mixed or non-numeric columns: compare every value against the last one kept
+    prev_value = seed
+    points = []
+    for ts, value in zip(timestamps, values):
+        norm_value = normalize(value)
+        if isinstance(norm_value, float) and isinstance(prev_value, float):
+            changed = abs(norm_value - prev_value) > epsilon
+        else:
+            changed = norm_value != prev_value
+        if changed:
+            points.append((float(ts), value))
+            prev_value = norm_value
+    return points, prev_value
+
+
+def backfill_changes(history, last_values, epsilon=DEFAULT_EPSILON):
+    """Suppress consecutive duplicates in a device's history, for all fields at once.
+
+    `last_values` maps each field to backfill to the last value already stored
+    (or None). Returns {field: (points, last_value)} where points is a list of
+    (timestamp, raw value) pairs to write and last_value is the normalized value
+    of the last point kept, or the normalized stored value if nothing was kept.
+    """
+    load_numpy()
+    columns = transpose_history(history, last_values)
+    changes = {}
+    for field, (timestamps, values) in columns.items():
+        seed = normalize(last_values[field])
+        if not values:
+            changes[field] = ([], seed)
+            continue
+        floats = _to_floats(values)
+        ts_floats = _to_floats(timestamps)
+        if floats is None or ts_floats is None:
+            changes[field] = _changes_scalar(timestamps, values, seed, epsilon)
+            continue
+        mask = _changed_mask(floats, seed, epsilon)
+        if np is not None:
+            kept = np.flatnonzero(mask).tolist()
+        else:
+            kept = [i for i, changed in enumerate(mask) if changed]
+        points = [(float(ts_floats[i]), values[i]) for i in kept]
+        last_value = float(floats[kept[-1]]) if kept else seed
+        changes[field] = (points, last_value)
+    return changes
@@ -1,19 +1,15 @@
 from homeassistant.components.button import ButtonEntity
 from .const import DOMAIN
+from .downlink import async_queue_command, downlink_options
 
 async def async_setup_entry(hass, entry, async_add_entities):
-    buttons = {}
+    buttons = hass.data[DOMAIN]["discovery_store"].async_restore_entities(entry, "button", ChirpstackHAButton)
 
-    async def handle_event(event):
-        dev_eui = event.get("deviceInfo", {}).get("devEui")
-        device_name = event.get("deviceInfo", {}).get("deviceName")
-        data = event.get("object", {})
-        discovery_info = data.get("discovery", {})
-        downlinks = discovery_info.get("commands", [])
+    async def handle_event(uplink, cmd_infos):
+        dev_eui = uplink.dev_eui
+        device_name = uplink.device_name
         new_entities = []
-        for cmd_info in downlinks:
-            if cmd_info.get("type") != "button":
-                continue
+        for cmd_info in cmd_infos:
             unique_id = f"{dev_eui}_{cmd_info['field']}"
             if unique_id not in buttons:
                 button = ChirpstackHAButton(dev_eui, cmd_info, device_name)
@@ -22,8 +18,8 @@ async def async_setup_entry(hass, entry, async_add_entities):
         if new_entities:
             async_add_entities(new_entities)
 
-    hass.data[DOMAIN]["entity_callbacks"].append(handle_event)
-    async_add_entities([])
+    hass.data[DOMAIN]["dispatcher"].async_register(entry.entry_id, "button", handle_event)
+    async_add_entities(list(buttons.values()))
 
 class ChirpstackHAButton(ButtonEntity):
     def __init__(self, dev_eui, cmd_info, device_name):
@@ -43,6 +39,7 @@ class ChirpstackHAButton(ButtonEntity):
         }
         self._pending_state = None
         self._attr_entity_registry_enabled_default = cmd_info.get("enabled_by_default", True)
+        self._f_port, self._confirmed = downlink_options(cmd_info)
 
         icon = cmd_info.get("icon")
         if icon:
@@ -56,8 +53,7 @@ class ChirpstackHAButton(ButtonEntity):
             self._attr_entity_category = None
 
     async def async_press(self):
-        # TODO: Send downlink via MQTT
-        pass
+        async_queue_command(self.hass, self._dev_eui, self._field, True, self._f_port, self._confirmed)
 
     async def async_added_to_hass(self):
         self._pending_state = None 
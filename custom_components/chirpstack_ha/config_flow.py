@@ -2,7 +2,8 @@ import voluptuous as vol
 import yaml
 from homeassistant import config_entries
 from homeassistant.core import callback
-from .const import DOMAIN
+from .const import DEFAULT_DOWNLINK_INTERVAL, DOMAIN
+from .runtime_config import async_update_runtime_config, is_valid_application_id
 import logging
 _LOGGER = logging.getLogger(__name__)
 
@@ -19,12 +20,15 @@ INFLUXDB_DEFAULTS = {
     "include_entities": "",
     "exclude_entities": "",
     "tags": "",
+    "diagnostic_sensors": False,
+    "downlink_interval": DEFAULT_DOWNLINK_INTERVAL,
+    "application_ids": "",
 }
 
 INFLUXDB_VERSIONS = ["1.x", "2.x"]
 
 OPTIONAL_FIELDS = [
-    "tags", "include_entities", "exclude_entities", "username", "password", "database", "bucket", "org", "token"
+    "tags", "include_entities", "exclude_entities", "username", "password", "database", "bucket", "org", "token", "application_ids"
 ]
 
 def mask_secrets(entry_data):
@@ -75,6 +79,9 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                     errors["org"] = "required"
                 if not user_input["token"]:
                     errors["token"] = "required"
+            application_ids = [a.strip() for a in user_input.get("application_ids", "").split(",") if a.strip()]
+            if not all(is_valid_application_id(a) for a in application_ids):
+                errors["application_ids"] = "invalid_application_ids"
             # Parse tags as YAML or key=value pairs
             tags = None
             tags_input = user_input.get("tags", "")
@@ -103,6 +110,8 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                         remove_key = True
                     elif key == "exclude_entities" and user_input.get("remove_exclude_entities"):
                         remove_key = True
+                    elif key == "application_ids" and user_input.get("remove_application_ids"):
+                        remove_key = True
                     value = user_input.get(key, None)
                     if remove_key or value is None or (isinstance(value, str) and not value.strip()):
                         entry.pop(key, None)
@@ -137,6 +146,7 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             schema_dict[vol.Required("token", default=data.get("token", INFLUXDB_DEFAULTS["token"]))] = str
         schema_dict[vol.Optional("include_entities", default=data.get("include_entities", INFLUXDB_DEFAULTS["include_entities"]))] = str
         schema_dict[vol.Optional("exclude_entities", default=data.get("exclude_entities", INFLUXDB_DEFAULTS["exclude_entities"]))] = str
+        schema_dict[vol.Optional("application_ids", default=data.get("application_ids", INFLUXDB_DEFAULTS["application_ids"]))] = str
         # Only show remove checkboxes if the field has a value
         if data.get("tags"):
             schema_dict[vol.Optional("remove_tags", default=False)] = bool
@@ -144,6 +154,10 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             schema_dict[vol.Optional("remove_include_entities", default=False)] = bool
         if data.get("exclude_entities"):
             schema_dict[vol.Optional("remove_exclude_entities", default=False)] = bool
+        if data.get("application_ids"):
+            schema_dict[vol.Optional("remove_application_ids", default=False)] = bool
+        schema_dict[vol.Optional("diagnostic_sensors", default=data.get("diagnostic_sensors", INFLUXDB_DEFAULTS["diagnostic_sensors"]))] = bool
+        schema_dict[vol.Optional("downlink_interval", default=data.get("downlink_interval", INFLUXDB_DEFAULTS["downlink_interval"]))] = vol.All(vol.Coerce(float), vol.Range(min=0))
         schema_dict[vol.Optional("tags", default=tags_str)]= str
         schema = vol.Schema(schema_dict)
         return self.async_show_form(
@@ -201,6 +215,9 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                     errors["org"] = "required"
                 if not user_input["token"]:
                     errors["token"] = "required"
+            application_ids = [a.strip() for a in user_input.get("application_ids", "").split(",") if a.strip()]
+            if not all(is_valid_application_id(a) for a in application_ids):
+                errors["application_ids"] = "invalid_application_ids"
             # Parse tags as YAML or key=value pairs
             tags = None
             tags_input = user_input.get("tags", "")
@@ -230,6 +247,8 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                         remove_key = True
                     elif key == "exclude_entities" and user_input.get("remove_exclude_entities"):
                         remove_key = True
+                    elif key == "application_ids" and user_input.get("remove_application_ids"):
+                        remove_key = True
                     value = user_input.get(key, None)
                     if remove_key or value is None or (isinstance(value, str) and not value.strip()):
                         entry.pop(key, None)
@@ -240,6 +259,7 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                 # Update hass.data[DOMAIN][entry_id] immediately
                 domain_data = self.hass.data.setdefault(DOMAIN, {})
                 domain_data[self.config_entry.entry_id] = entry
+                async_update_runtime_config(self.hass, self.config_entry.entry_id, entry)
                 return self.async_create_entry(title="", data={})
         # Prepare tags field as string
         tags_str = data.get("tags", "")
@@ -262,6 +282,7 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             schema_dict[vol.Required("token", default=data.get("token", INFLUXDB_DEFAULTS["token"]))] = str
         schema_dict[vol.Optional("include_entities", default=data.get("include_entities", INFLUXDB_DEFAULTS["include_entities"]))] = str
         schema_dict[vol.Optional("exclude_entities", default=data.get("exclude_entities", INFLUXDB_DEFAULTS["exclude_entities"]))] = str
+        schema_dict[vol.Optional("application_ids", default=data.get("application_ids", INFLUXDB_DEFAULTS["application_ids"]))] = str
         # Only show remove checkboxes if the field has a value
         if data.get("tags"):
             schema_dict[vol.Optional("remove_tags", default=False)] = bool
@@ -269,6 +290,10 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             schema_dict[vol.Optional("remove_include_entities", default=False)] = bool
         if data.get("exclude_entities"):
             schema_dict[vol.Optional("remove_exclude_entities", default=False)] = bool
+        if data.get("application_ids"):
+            schema_dict[vol.Optional("remove_application_ids", default=False)] = bool
+        schema_dict[vol.Optional("diagnostic_sensors", default=data.get("diagnostic_sensors", INFLUXDB_DEFAULTS["diagnostic_sensors"]))] = bool
+        schema_dict[vol.Optional("downlink_interval", default=data.get("downlink_interval", INFLUXDB_DEFAULTS["downlink_interval"]))] = vol.All(vol.Coerce(float), vol.Range(min=0))
         schema_dict[vol.Optional("tags", default=tags_str)] = str
         schema = vol.Schema(schema_dict)
         return self.async_show_form(
@@ -1,3 +1,19 @@
 DOMAIN = "chirpstack_ha"
 INFLUXDB_CONFIG_RAW = "influxdb_config_raw"
-INFLUXDB_CONFIG = "influxdb_config" 
\ No newline at end of file
+INFLUXDB_CONFIG = "influxdb_config"
+# Minimum seconds between two downlinks to the same device
+DEFAULT_DOWNLINK_INTERVAL = 10.0
+# Devices whose uplinks are processed at the same time; a device's own uplinks always run in order
+DEFAULT_MAX_IN_FLIGHT_DEVICES = 16
+# Pending uplinks per device before new ones are merged into the last pending one
+DEFAULT_MAX_QUEUED_PER_DEVICE = 4
+# Pending uplinks in total before new ones are merged, or dropped for devices with none pending
+DEFAULT_MAX_QUEUED_UPLINKS = 5000
+# History entries kept when merging pending uplinks; the oldest are dropped beyond this
+MAX_MERGED_HISTORY = 1000
+# Seconds one platform may spend on an uplink before it is abandoned
+HANDLER_TIMEOUT = 30.0
+# Seconds an uplink waits for its InfluxDB last values, warm-up included, before treating the rest as unknown
+INFLUX_QUERY_TIMEOUT = 5.0
+# Seconds queued uplinks get to finish when the integration is unloaded
+SHUTDOWN_TIMEOUT = 10.0
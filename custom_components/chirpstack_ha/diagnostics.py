@@ -0,0 +1,34 @@
+from homeassistant.components.diagnostics import async_redact_data
+from .const import DOMAIN
+
+TO_REDACT = {"token", "password", "username"}
+
+
+async def async_get_config_entry_diagnostics(hass, entry):
+    """Configuration, pipeline metrics and queue state for a config entry."""
+    domain_data = hass.data.get(DOMAIN, {})
+    config = domain_data.get("runtime_configs", {}).get(entry.entry_id)
+    dispatcher = domain_data.get("dispatcher")
+    writer = domain_data.get("influxdb_writers", {}).get(entry.entry_id)
+    metrics = domain_data.get("metrics")
+    discovery_store = domain_data.get("discovery_store")
+    return {
+        "entry": async_redact_data(dict(entry.data), TO_REDACT),
+        "runtime_config": {
+            "revision": config.revision,
+            "version": config.version,
+            "include": sorted(config.include),
+            "exclude": sorted(config.exclude),
+            "application_ids": sorted(config.application_ids),
+        } if config else None,
+        "dispatcher": {
+            "subscribed": dispatcher.subscribed,
+            "known_devices": dispatcher.known_devices,
+            "scheduler": dispatcher.scheduler.as_dict(),
+            "topics": dispatcher.topics,
+            "routes": dispatcher.routes,
+        } if dispatcher else None,
+        "stored_devices": len(discovery_store) if discovery_store is not None else None,
+        "influxdb_writer": writer.as_dict() if writer else None,
+        "metrics": metrics.as_dict() if metrics else None,
+    }
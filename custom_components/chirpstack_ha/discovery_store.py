@@ -0,0 +1,143 @@
+import logging
+from homeassistant.components.sensor import RestoreSensor
+from homeassistant.const import STATE_UNAVAILABLE, STATE_UNKNOWN
+from homeassistant.core import callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.storage import Store
+from .const import DOMAIN
+from .dispatcher import COMMAND_PLATFORMS, SENSOR_PLATFORM
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_KEY = f"{DOMAIN}.discovery"
+STORAGE_VERSION = 1
+# Seconds to gather discovery changes into one write
+SAVE_DELAY = 30
+
+
+def _spec_items(dev_eui, device):
+    """Yield ((platform, unique_id), info) for every entity in a stored device."""
+    for info in device.get("sensors") or ():
+        yield (SENSOR_PLATFORM, f"{dev_eui}_{info['field']}"), info
+    for platform, infos in (device.get("commands") or {}).items():
+        for info in infos:
+            yield (platform, f"{dev_eui}_{info['field']}"), info
+
+
+class DiscoveryStore:
+    """Last discovery block of every device, persisted across restarts.
+
+    Platforms recreate their entities from it at setup, with full metadata,
+    instead of waiting for each device's next uplink; last states come back
+    through RestoreEntity. Changes are written with Store's delayed save, so
+    a burst of new or changed devices costs a single write.
+    """
+
+    def __init__(self, hass):
+        self._hass = hass
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        # dev_eui -> {"device_name", "application_id", "sensors", "commands"}
+        self._devices = {}
+        # (platform, unique_id) -> (dev_eui, device_name, info)
+        self._specs = {}
+
+    def __len__(self):
+        return len(self._devices)
+
+    async def async_load(self):
+        data = await self._store.async_load() or {}
+        for dev_eui, device in (data.get("devices") or {}).items():
+            self._set(dev_eui, device)
+        _LOGGER.debug("Loaded discovery for %d devices (%d entities)", len(self._devices), len(self._specs))
+
+    def _set(self, dev_eui, device):
+        previous = self._devices.get(dev_eui)
+        if previous is not None:
+            for key, _info in _spec_items(dev_eui, previous):
+                self._specs.pop(key, None)
+        self._devices[dev_eui] = device
+        device_name = device.get("device_name")
+        for key, info in _spec_items(dev_eui, device):
+            self._specs[key] = (dev_eui, device_name, info)
+
+    def application_ids(self):
+        """Yield (dev_eui, application_id) for the stored devices."""
+        for dev_eui, device in self._devices.items():
+            if device.get("application_id"):
+                yield dev_eui, device["application_id"]
+
+    def known_discovery(self, dev_eui):
+        """Return (None, sensors, commands) of a stored device, as the dispatcher keeps them, or None."""
+        device = self._devices.get(dev_eui)
+        if device is None:
+            return None
+        return None, device.get("sensors") or [], device.get("commands") or {}
+
+    def get(self, platform, unique_id):
+        """Return (dev_eui, device_name, info) for an entity, or None."""
+        return self._specs.get((platform, unique_id))
+
+    @callback
+    def async_update(self, uplink):
+        """Record an uplink's discovery block, scheduling a save if it changed."""
+        device = {
+            "device_name": uplink.device_name,
+            "application_id": uplink.application_id,
+            "sensors": list(uplink.sensors),
+            "commands": {platform: list(infos) for platform, infos in uplink.commands.items() if platform in COMMAND_PLATFORMS},
+        }
+        if self._devices.get(uplink.dev_eui) == device:
+            return
+        self._set(uplink.dev_eui, device)
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    def _data_to_save(self):
+        return {"devices": self._devices}
+
+    @callback
+    def async_restore_entities(self, entry, platform, factory):
+        """Recreate an entry's registered entities of a platform from their stored discovery.
+
+        `factory(dev_eui, info, device_name)` builds each entity. Returns
+        {unique_id: entity}; entities without a stored spec are left for the
+        next uplink of their device to create.
+        """
+        restored = {}
+        entity_reg = er.async_get(self._hass)
+        for entry_entity in er.async_entries_for_config_entry(entity_reg, entry.entry_id):
+            if entry_entity.domain != platform or entry_entity.platform != DOMAIN:
+                continue
+            spec = self._specs.get((platform, entry_entity.unique_id))
+            if spec is None:
+                continue
+            dev_eui, device_name, info = spec
+            entity = factory(dev_eui, info, device_name)
+            # Keep the registered entity_id, even if it was renamed
+            entity.entity_id = entry_entity.entity_id
+            restored[entry_entity.unique_id] = entity
+        return restored
+
+    async def async_stop(self):
+        """Write the current devices now instead of waiting for the delayed save."""
+        await self._store.async_save(self._data_to_save())
+
+
+async def async_restore_last_state(entity, apply):
+    """Show an entity's last value from before the restart until its device reports again.
+
+    `apply` sets the value on the entity and raises ValueError to ignore a
+    stored state that no longer fits it.
+    """
+    if isinstance(entity, RestoreSensor):
+        last_data = await entity.async_get_last_sensor_data()
+        value = None if last_data is None else last_data.native_value
+    else:
+        last_state = await entity.async_get_last_state()
+        value = None if last_state is None or last_state.state in (STATE_UNKNOWN, STATE_UNAVAILABLE) else last_state.state
+    if value is None:
+        return
+    try:
+        apply(value)
+    except ValueError:
+        return
+    entity.async_write_ha_state()
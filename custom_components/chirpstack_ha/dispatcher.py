@@ -0,0 +1,316 @@
+import asyncio
+import hashlib
+import json
+import logging
+from time import perf_counter
+from homeassistant.core import callback
+from .const import HANDLER_TIMEOUT, MAX_MERGED_HISTORY
+from .decoder import decode_uplink
+from .metrics import Metrics
+from .scheduler import DeviceScheduler
+
+_LOGGER = logging.getLogger(__name__)
+
+UPLINK_TOPIC = "application/+/device/+/event/up"
+APPLICATION_UPLINK_TOPIC = "application/{application_id}/device/+/event/up"
+
+SENSOR_PLATFORM = "sensor"
+COMMAND_PLATFORMS = ("button", "number", "select", "switch", "text")
+# Fingerprint of a device's discovery taken from storage, once its entities were reconciled
+STORED_FINGERPRINT = ("stored",)
+
+
+def discovery_fingerprint(device_name, discovery_info):
+    """Cheap fingerprint of a device's discovery block.
+
+    Codecs may supply `discovery.version`; otherwise the canonical JSON bytes
+    are hashed. The device name is included because entity names derive from it.
+    """
+    version = discovery_info.get("version")
+    if version is not None:
+        return (device_name, "version", version)
+    canonical = json.dumps(discovery_info, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return (device_name, hashlib.blake2b(canonical, digest_size=16).digest())
+
+
+class Uplink:
+    """A ChirpStack uplink event, parsed once and split by entity type."""
+
+    __slots__ = (
+        "event",
+        "dev_eui",
+        "device_name",
+        "application_id",
+        "application_name",
+        "values",
+        "history",
+        "sensors",
+        "commands",
+        "fingerprint",
+        "discovery_changed",
+        "entry_id",
+    )
+
+    def __init__(self, event, known_discovery=None):
+        device_info = event.get("deviceInfo") or {}
+        self.event = event
+        self.dev_eui = device_info.get("devEui")
+        self.device_name = device_info.get("deviceName")
+        self.application_id = device_info.get("applicationId")
+        self.application_name = device_info.get("applicationName")
+        # Config entry the uplink is routed to, set by the dispatcher
+        self.entry_id = None
+        data = event.get("object")
+        if not isinstance(data, dict):
+            data = {}
+        discovery_info = data.get("discovery") or {}
+        self.history = data.get("history") or []
+        # Typed values reported by the codec, without the discovery/history blocks
+        self.values = {k: v for k, v in data.items() if k != "discovery" and k != "history"}
+        if not discovery_info:
+            # Codecs may send the discovery block only now and then; keep the device's last one
+            self.discovery_changed = False
+            self.fingerprint = None
+            self.sensors, self.commands = [], {}
+            if known_discovery is not None:
+                # Discovery loaded from storage (no fingerprint) still needs its entities reconciled
+                self.discovery_changed = known_discovery[0] is None
+                self.fingerprint = STORED_FINGERPRINT if self.discovery_changed else known_discovery[0]
+                self.sensors, self.commands = known_discovery[1], known_discovery[2]
+            return
+        self.fingerprint = discovery_fingerprint(self.device_name, discovery_info)
+        if known_discovery is not None and known_discovery[0] == self.fingerprint:
+            # Steady state: reuse the grouping from the last uplink of this device
+            self.discovery_changed = False
+            self.sensors, self.commands = known_discovery[1], known_discovery[2]
+            return
+        self.discovery_changed = True
+        self.sensors = discovery_info.get("sensors") or []
+        # Group commands by entity type in a single pass
+        commands = {}
+        for cmd_info in discovery_info.get("commands") or []:
+            commands.setdefault(cmd_info.get("type"), []).append(cmd_info)
+        self.commands = commands
+
+    def merge_pending(self, older):
+        """Fold an older, not yet processed uplink of the same device into this one.
+
+        Values keep the latest per field, the history of both is kept in order
+        for InfluxDB, and a discovery change in either is still handled.
+        """
+        if older.values:
+            self.values = {**older.values, **self.values}
+        if older.history:
+            self.history = older.history + self.history
+        self.discovery_changed = self.discovery_changed or older.discovery_changed
+        return self
+
+    def platform_slice(self, platform):
+        """Return the discovery entries owned by the given platform."""
+        if platform == SENSOR_PLATFORM:
+            return self.sensors
+        return self.commands.get(platform, ())
+
+
+class UplinkDispatcher:
+    """Single MQTT subscriber that routes parsed uplinks to the platforms of one entry.
+
+    Config entries may own a set of ChirpStack application IDs. Each uplink
+    goes to exactly one entry, found by application ID, or else to the entry
+    without application IDs, which takes all other applications. Only the
+    owned applications' topics are subscribed unless such an entry exists.
+    Messages are decoded as they arrive and handed to a DeviceScheduler, so
+    platform handlers run in order per device but never hold up other devices.
+    """
+
+    def __init__(self, hass, metrics=None):
+        self.hass = hass
+        self.metrics = metrics if metrics is not None else Metrics()
+        # platform -> {entry_id: handler}
+        self._handlers = {}
+        # dev_eui -> (fingerprint, sensors, commands) of the last discovery block handled
+        self._discovery = {}
+        # application_id -> entry_id, and the entry taking all other applications
+        self._routes = {}
+        self._catch_all = None
+        # topic -> unsubscribe callback
+        self._subscriptions = {}
+        self._subscription_lock = asyncio.Lock()
+        self._mqtt = None
+        self.scheduler = DeviceScheduler(hass, self._async_process, metrics=self.metrics, coalesce=self._coalesce)
+        # DownlinkScheduler learning application IDs from uplinks
+        self.downlinks = None
+        # DiscoveryStore persisting discovery blocks for restarts
+        self.discovery_store = None
+
+    @property
+    def subscribed(self):
+        return self._mqtt is not None
+
+    @property
+    def topics(self):
+        return sorted(self._subscriptions)
+
+    @property
+    def routes(self):
+        return {"applications": dict(self._routes), "catch_all": self._catch_all}
+
+    @property
+    def known_devices(self):
+        return len(self._discovery)
+
+    @property
+    def has_handlers(self):
+        return any(self._handlers.values())
+
+    def async_register(self, entry_id, platform, handler):
+        """Register handler(uplink, infos) for a config entry's platform."""
+        self._handlers.setdefault(platform, {})[entry_id] = handler
+        # A new handler has no entities yet: let every device reconcile again
+        self._discovery.clear()
+
+    def async_unregister_entry(self, entry_id):
+        for handlers in self._handlers.values():
+            handlers.pop(entry_id, None)
+        self._discovery.clear()
+
+    def async_set_routes(self, application_ids_by_entry):
+        """Set the application IDs owned by each entry, in entry setup order.
+
+        An application claimed by two entries, or a second entry without
+        application IDs, stays with the first entry.
+        """
+        routes = {}
+        catch_all = None
+        for entry_id, application_ids in application_ids_by_entry.items():
+            if not application_ids:
+                if catch_all is None:
+                    catch_all = entry_id
+                else:
+                    _LOGGER.warning("Entries %s and %s both take all applications; only %s receives uplinks", catch_all, entry_id, catch_all)
+                continue
+            for application_id in application_ids:
+                owner = routes.setdefault(application_id, entry_id)
+                if owner != entry_id:
+                    _LOGGER.warning("Application %s is claimed by entries %s and %s; only %s receives its uplinks", application_id, owner, entry_id, owner)
+        if routes == self._routes and catch_all == self._catch_all:
+            return
+        self._routes = routes
+        self._catch_all = catch_all
+        # Devices may now go to an entry without their entities: let every device reconcile again
+        self._discovery.clear()
+        if self._mqtt is not None:
+            self.hass.async_create_task(self._async_sync_subscriptions())
+
+    def _wanted_topics(self):
+        if self._catch_all is not None:
+            return {UPLINK_TOPIC}
+        return {APPLICATION_UPLINK_TOPIC.format(application_id=application_id) for application_id in self._routes}
+
+    async def _async_sync_subscriptions(self):
+        async with self._subscription_lock:
+            if self._mqtt is None:
+                return
+            wanted = self._wanted_topics()
+            for topic in list(self._subscriptions):
+                if topic not in wanted:
+                    self._subscriptions.pop(topic)()
+            for topic in sorted(wanted - self._subscriptions.keys()):
+                # Subscribe with raw bytes so the payload is decoded exactly once
+                self._subscriptions[topic] = await self._mqtt.async_subscribe(self.hass, topic, self.async_message_received, encoding=None)
+            _LOGGER.debug("Subscribed to %s", sorted(self._subscriptions))
+
+    async def async_subscribe(self, mqtt):
+        if self._mqtt is None:
+            self._mqtt = mqtt
+            try:
+                await self._async_sync_subscriptions()
+            except Exception:
+                # Leave nothing half-subscribed so the next attempt starts over
+                self.async_unsubscribe()
+                raise
+
+    def async_unsubscribe(self):
+        self._mqtt = None
+        for unsubscribe in self._subscriptions.values():
+            unsubscribe()
+        self._subscriptions.clear()
+
+    @callback
+    def async_message_received(self, msg):
+        _LOGGER.debug("Received MQTT message: %s", msg.payload)
+        metrics = self.metrics
+        metrics.inc("messages")
+        start = perf_counter()
+        try:
+            event = decode_uplink(msg.payload)
+            decoded = perf_counter()
+            dev_eui = (event.get("deviceInfo") or {}).get("devEui")
+            known = self._discovery.get(dev_eui)
+            if known is None and self.discovery_store is not None:
+                # Not seen since startup or a reload: start from the stored discovery
+                known = self.discovery_store.known_discovery(dev_eui)
+            uplink = Uplink(event, known)
+        except Exception as e:
+            metrics.inc("parse_errors")
+            _LOGGER.exception("Error parsing ChirpStack MQTT message: %s", e)
+            return
+        metrics.observe("decode", decoded - start)
+        metrics.observe("discovery", perf_counter() - decoded)
+        if not uplink.dev_eui:
+            _LOGGER.warning("No devEui found in ChirpStack event, skipping message")
+            return
+        uplink.entry_id = self._routes.get(uplink.application_id, self._catch_all)
+        if uplink.entry_id is None:
+            # Left over from a subscription that is being replaced
+            metrics.inc("uplinks_unrouted")
+            return
+        metrics.inc_entry(uplink.entry_id, "messages")
+        if self.downlinks is not None:
+            self.downlinks.async_uplink_received(uplink.dev_eui, uplink.application_id)
+        if not self.scheduler.submit(uplink.dev_eui, uplink):
+            # Dropped: a changed discovery block must still count as changed on the next uplink
+            return
+        if uplink.discovery_changed:
+            metrics.inc("discovery_changes")
+            self._discovery[uplink.dev_eui] = (uplink.fingerprint, uplink.sensors, uplink.commands)
+            if self.discovery_store is not None:
+                self.discovery_store.async_update(uplink)
+
+    def _coalesce(self, older, newer):
+        newer.merge_pending(older)
+        excess = len(newer.history) - MAX_MERGED_HISTORY
+        if excess > 0:
+            newer.history = newer.history[excess:]
+            self.metrics.inc("history_dropped", excess)
+        return newer
+
+    async def _async_process(self, uplink):
+        await self.async_dispatch(uplink)
+
+    async def async_dispatch(self, uplink):
+        for platform, handlers in self._handlers.items():
+            handler = handlers.get(uplink.entry_id)
+            infos = uplink.platform_slice(platform)
+            # Platforms with nothing in this uplink are not woken up at all;
+            # command platforms only create entities, so they also skip unchanged discovery
+            if handler is None or not infos or (platform != SENSOR_PLATFORM and not uplink.discovery_changed):
+                continue
+            try:
+                async with asyncio.timeout(HANDLER_TIMEOUT):
+                    await handler(uplink, infos)
+            except TimeoutError:
+                self.metrics.inc("handler_timeouts")
+                _LOGGER.warning("Abandoned ChirpStack uplink for %s in %s platform after %ss", uplink.dev_eui, platform, HANDLER_TIMEOUT)
+                self._forget_failed_discovery(uplink)
+            except Exception as e:
+                self.metrics.inc("handler_errors")
+                _LOGGER.exception("Error processing ChirpStack uplink for %s in %s platform: %s", uplink.dev_eui, platform, e)
+                self._forget_failed_discovery(uplink)
+
+    def _forget_failed_discovery(self, uplink):
+        """Let the device's next uplink reconcile its entities again after a failed discovery change."""
+        known = self._discovery.get(uplink.dev_eui)
+        # Unless a newer block was recorded meanwhile
+        if uplink.discovery_changed and known is not None and known[0] == uplink.fingerprint:
+            del self._discovery[uplink.dev_eui]
@@ -0,0 +1,142 @@
+import json
+import logging
+import time
+from homeassistant.components import mqtt
+from homeassistant.helpers.event import async_call_later
+from .const import DEFAULT_DOWNLINK_INTERVAL, DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+DOWNLINK_TOPIC = "application/{application_id}/device/{dev_eui}/command/down"
+DEFAULT_FPORT = 10
+# Seconds to wait after the first change so rapid follow-ups go out together
+DEFAULT_COALESCE_DELAY = 1.0
+
+
+class _DeviceQueue:
+    __slots__ = ("pending", "next_allowed", "cancel_timer")
+
+    def __init__(self):
+        # (fPort, confirmed) -> {field: value}, in the order the groups were first queued
+        self.pending = {}
+        self.next_allowed = 0.0
+        self.cancel_timer = None
+
+
+class DownlinkScheduler:
+    """Per-device downlink queues with coalescing, merging and a rate limit.
+
+    Command entities only queue a field value. Changes to the same field
+    before the device's next downlink replace each other, and all fields
+    queued for the same fPort are merged into one `object`. Each device gets
+    at most one downlink per `min_interval` seconds, since every downlink
+    costs airtime and sits in ChirpStack's device queue until the next uplink.
+    Application IDs are learned from uplinks; changes for a device not heard
+    from since startup wait for its first uplink.
+    """
+
+    def __init__(self, hass, min_interval=DEFAULT_DOWNLINK_INTERVAL, coalesce_delay=DEFAULT_COALESCE_DELAY, metrics=None):
+        self.hass = hass
+        self.min_interval = min_interval
+        self.coalesce_delay = coalesce_delay
+        self._metrics = metrics
+        self._queues = {}
+        self._application_ids = {}
+
+    def _inc(self, name, amount=1):
+        if self._metrics is not None:
+            self._metrics.inc(name, amount)
+
+    def async_uplink_received(self, dev_eui, application_id):
+        if not application_id or self._application_ids.get(dev_eui) == application_id:
+            return
+        self._application_ids[dev_eui] = application_id
+        queue = self._queues.get(dev_eui)
+        if queue is not None and queue.pending:
+            self._async_schedule(dev_eui, queue)
+
+    def async_queue(self, dev_eui, field, value, f_port=DEFAULT_FPORT, confirmed=False):
+        """Queue a field value for the device's next downlink."""
+        queue = self._queues.get(dev_eui)
+        if queue is None:
+            queue = self._queues[dev_eui] = _DeviceQueue()
+        fields = queue.pending.setdefault((f_port, confirmed), {})
+        if field in fields:
+            self._inc("downlinks_coalesced")
+        fields[field] = value
+        self._inc("downlink_changes")
+        self._async_schedule(dev_eui, queue)
+
+    def _async_schedule(self, dev_eui, queue):
+        if queue.cancel_timer is not None:
+            return
+        if dev_eui not in self._application_ids:
+            _LOGGER.debug("Holding downlink for %s until its first uplink", dev_eui)
+            return
+        delay = max(self.coalesce_delay, queue.next_allowed - time.monotonic())
+
+        async def _async_flush_later(_now):
+            queue.cancel_timer = None
+            await self._async_send_next(dev_eui, queue)
+
+        queue.cancel_timer = async_call_later(self.hass, delay, _async_flush_later)
+
+    async def _async_send_next(self, dev_eui, queue):
+        if not queue.pending:
+            return
+        # One (fPort, confirmed) group per downlink; the rest wait for the next slot
+        key = next(iter(queue.pending))
+        fields = queue.pending.pop(key)
+        queue.next_allowed = time.monotonic() + self.min_interval
+        await self._async_publish(dev_eui, key, fields)
+        if queue.pending:
+            self._async_schedule(dev_eui, queue)
+
+    async def _async_publish(self, dev_eui, key, fields):
+        f_port, confirmed = key
+        topic = DOWNLINK_TOPIC.format(application_id=self._application_ids[dev_eui], dev_eui=dev_eui)
+        payload = json.dumps({"devEui": dev_eui, "confirmed": confirmed, "fPort": f_port, "object": fields})
+        try:
+            await mqtt.async_publish(self.hass, topic, payload, qos=0, retain=False)
+        except Exception as e:
+            self._inc("downlink_errors")
+            _LOGGER.error("Failed to publish downlink for %s: %s", dev_eui, e)
+            return
+        self._inc("downlinks_sent")
+        _LOGGER.debug("Sent downlink to %s on fPort %s: %s", dev_eui, f_port, fields)
+
+    async def async_stop(self):
+        """Cancel the timers and send what the rate limit still allows.
+
+        A device whose slot is open gets its next queued group; the rest of the
+        queue is dropped, since waiting `min_interval` between downlinks would
+        hold up the unload.
+        """
+        queues, self._queues = self._queues, {}
+        now = time.monotonic()
+        dropped = 0
+        for dev_eui, queue in queues.items():
+            if queue.cancel_timer is not None:
+                queue.cancel_timer()
+                queue.cancel_timer = None
+            if queue.pending and dev_eui in self._application_ids and queue.next_allowed <= now:
+                key = next(iter(queue.pending))
+                await self._async_publish(dev_eui, key, queue.pending.pop(key))
+            dropped += len(queue.pending)
+        if dropped:
+            self._inc("downlinks_dropped", dropped)
+            _LOGGER.warning("Dropping %d queued downlinks at shutdown (rate limited or waiting for their device's first uplink)", dropped)
+
+
+def downlink_options(cmd_info):
+    """(fPort, confirmed) for a command, overridable per command in the codec's discovery block."""
+    return cmd_info.get("fPort", DEFAULT_FPORT), bool(cmd_info.get("confirmed", False))
+
+
+def async_queue_command(hass, dev_eui, field, value, f_port=DEFAULT_FPORT, confirmed=False):
+    """Queue a command entity's new value as a downlink."""
+    scheduler = hass.data.get(DOMAIN, {}).get("downlinks")
+    if scheduler is None:
+        _LOGGER.warning("Downlinks are not available, dropping %s for %s", field, dev_eui)
+        return
+    scheduler.async_queue(dev_eui, field, value, f_port, confirmed)
@@ -0,0 +1,65 @@
+import logging
+from homeassistant.core import callback
+from homeassistant.helpers import entity_registry as er
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class EntityIndex:
+    """unique_id -> entity_id lookup for ChirpStack entities.
+
+    Built once from the entity registry and kept current through entity
+    registry update events, so uplink handling never scans the registry.
+    """
+
+    def __init__(self, hass):
+        self.hass = hass
+        # (config_entry_id, domain, unique_id) -> entity_id
+        self._entity_ids = {}
+        # entity_id -> (config_entry_id, domain, unique_id)
+        self._keys = {}
+        self._unsub = None
+
+    def async_start(self):
+        entity_reg = er.async_get(self.hass)
+        for entity in entity_reg.entities.values():
+            self._async_add(entity)
+        self._unsub = self.hass.bus.async_listen(er.EVENT_ENTITY_REGISTRY_UPDATED, self._async_registry_updated)
+        _LOGGER.debug("Entity index built with %d ChirpStack entities", len(self._entity_ids))
+
+    def async_stop(self):
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+        self._entity_ids.clear()
+        self._keys.clear()
+
+    def get(self, entry_id, domain, unique_id):
+        return self._entity_ids.get((entry_id, domain, unique_id))
+
+    def _async_add(self, entity):
+        if entity.platform != DOMAIN:
+            return
+        key = (entity.config_entry_id, entity.domain, entity.unique_id)
+        self._entity_ids[key] = entity.entity_id
+        self._keys[entity.entity_id] = key
+
+    def _async_remove(self, entity_id):
+        key = self._keys.pop(entity_id, None)
+        if key is not None and self._entity_ids.get(key) == entity_id:
+            del self._entity_ids[key]
+
+    @callback
+    def _async_registry_updated(self, event):
+        action = event.data.get("action")
+        entity_id = event.data.get("entity_id")
+        if action == "update" and event.data.get("old_entity_id"):
+            self._async_remove(event.data["old_entity_id"])
+        self._async_remove(entity_id)
+        if action == "remove":
+            return
+        # Re-read the entry: unique_id, config entry or entity_id may have changed
+        entity = er.async_get(self.hass).async_get(entity_id)
+        if entity is not None:
+            self._async_add(entity)
@@ -0,0 +1,116 @@
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+
+_LOGGER = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class FilterState:
+    """Last value kept for one entity and output, and when it was kept."""
+
+    __slots__ = ("value", "timestamp")
+
+    def __init__(self, value=MISSING, timestamp=None):
+        self.value = value
+        self.timestamp = timestamp
+
+
+@dataclass(frozen=True)
+class ChangeFilter:
+    """Significant-change filter declared by a discovery sensor spec.
+
+    A value is kept when it differs from the last kept value by more than
+    `deadband` (a percentage of the last kept value if `relative`), or when
+    it differs at all if no deadband is set. Values arriving less than
+    `min_interval` seconds after the last kept one are dropped, and a value
+    is always kept once `max_interval` seconds have passed (heartbeat).
+    Intervals are skipped when either timestamp is unknown.
+    """
+
+    deadband: float = None
+    relative: bool = False
+    min_interval: float = None
+    max_interval: float = None
+
+    def changed(self, last, value):
+        if self.deadband is None:
+            return type(last) is not type(value) or last != value
+        try:
+            last_float = float(last)
+            value_float = float(value)
+        except (TypeError, ValueError):
+            return last != value
+        band = abs(last_float) * self.deadband / 100 if self.relative else self.deadband
+        return abs(value_float - last_float) > band
+
+    def accept(self, state, value, timestamp):
+        """Return whether to keep value, recording it in state if so."""
+        last = state.value
+        if last is not MISSING:
+            if timestamp is not None and state.timestamp is not None:
+                elapsed = timestamp - state.timestamp
+                if self.max_interval is not None and elapsed >= self.max_interval:
+                    pass
+                elif self.min_interval is not None and elapsed < self.min_interval:
+                    return False
+                elif not self.changed(last, value):
+                    return False
+            elif not self.changed(last, value):
+                return False
+        state.value = value
+        state.timestamp = timestamp
+        return True
+
+
+# Plain change detection, for sensors whose spec declares no filter
+DEFAULT_FILTER = ChangeFilter()
+
+
+def _seconds(field, key, value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0:
+        return float(value)
+    _LOGGER.warning("Ignoring invalid %s %r for field %s", key, value, field)
+    return None
+
+
+@lru_cache(maxsize=4096)
+def _build_filter(field, deadband, min_interval, max_interval):
+    raw, relative = deadband, False
+    if isinstance(deadband, str):
+        text = deadband.strip()
+        relative = text.endswith("%")
+        try:
+            deadband = float(text.rstrip("%"))
+        except ValueError:
+            deadband = -1.0
+    if deadband is not None and (isinstance(deadband, bool) or not isinstance(deadband, (int, float)) or deadband < 0):
+        _LOGGER.warning("Ignoring invalid deadband %r for field %s", raw, field)
+        deadband = None
+        relative = False
+    change_filter = ChangeFilter(
+        deadband=float(deadband) if deadband is not None else None,
+        relative=relative,
+        min_interval=_seconds(field, "min_interval", min_interval),
+        max_interval=_seconds(field, "max_interval", max_interval),
+    )
+    return DEFAULT_FILTER if change_filter == DEFAULT_FILTER else change_filter
+
+
+def change_filter_for(sensor_info):
+    """Resolve the filter for a discovery sensor spec.
+
+    `deadband` is an absolute number or a percentage string such as "2%";
+    `min_interval` and `max_interval` are in seconds.
+    """
+    options = (sensor_info.get("deadband"), sensor_info.get("min_interval"), sensor_info.get("max_interval"))
+    if options == (None, None, None):
+        return DEFAULT_FILTER
+    try:
+        return _build_filter(sensor_info["field"], *options)
+    except TypeError:  # Unhashable option, such as a list
+        _LOGGER.warning("Ignoring invalid filter options %r for field %s", options, sensor_info["field"])
+        return DEFAULT_FILTER
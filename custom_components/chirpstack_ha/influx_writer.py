@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUEUE = 50_000
+DEFAULT_BATCH_SIZE = 1_000
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+
+class InfluxWriter:
+    """Batched InfluxDB writer running as a background task.
+
+    Uplink handling only enqueues line protocol chunks; a background task
+    groups them across sensors and devices and writes them from the executor
+    once a batch is full or the oldest queued chunk reaches the flush
+    interval. The queue is bounded in points: on overflow the oldest chunks
+    are dropped.
+    """
+
+    def __init__(self, hass, client, write_api, bucket, org=None, max_queue=DEFAULT_MAX_QUEUE, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, metrics=None):
+        self.hass = hass
+        self._metrics = metrics
+        self._client = client
+        self._write_api = write_api
+        self._bucket = bucket
+        self._org = org
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_queue = max_queue
+        # (line protocol bytes, point count) chunks
+        self._queue = deque()
+        self._queued = 0
+        self._oldest = None
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._unsub_stop = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        # Batch writes and their total seconds, for this writer's own latency
+        self._writes = 0
+        self._write_seconds = 0.0
+        self._latency_mark = (0, 0.0)
+
+    @property
+    def queue_depth(self):
+        return self._queued
+
+    def as_dict(self):
+        return {
+            "queue_depth": self._queued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    def recent_write_latency(self):
+        """Mean batch write time, in seconds, since the previous call."""
+        last_writes, last_seconds = self._latency_mark
+        self._latency_mark = (self._writes, self._write_seconds)
+        count = self._writes - last_writes
+        return (self._write_seconds - last_seconds) / count if count else 0.0
+
+    def async_start(self):
+        self._task = self.hass.async_create_background_task(self._async_run(), "chirpstack_ha influxdb writer")
+        self._unsub_stop = self.hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self._async_handle_stop)
+
+    def async_enqueue(self, data, count):
+        """Queue `count` newline-terminated line protocol points for writing; never blocks."""
+        if not count or self._stopping:
+            return
+        queue = self._queue
+        if not queue:
+            self._oldest = time.monotonic()
+            self._wakeup.set()
+        queue.append((data, count))
+        self._queued += count
+        while self._queued > self._max_queue and len(queue) > 1:
+            _, dropped = queue.popleft()
+            if not self.dropped:
+                _LOGGER.warning("[InfluxDB] Write queue full (%d points), dropping oldest points", self._max_queue)
+            self._queued -= dropped
+            self.dropped += dropped
+        if self._queued >= self._batch_size:
+            self._wakeup.set()
+
+    async def async_stop(self):
+        """Stop the background task and drain everything still queued."""
+        if self._stopping:
+            return
+        self._stopping = True
+        if self._unsub_stop is not None:
+            self._unsub_stop()
+            self._unsub_stop = None
+        self._wakeup.set()
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            try:
+                await task
+            except asyncio.CancelledError:
+                # Home Assistant cancels background tasks before EVENT_HOMEASSISTANT_STOP;
+                # the queue is still drained below unless this stop itself is cancelled
+                if asyncio.current_task().cancelling():
+                    raise
+        await self._async_flush(force=True)
+        await self.hass.async_add_executor_job(self._close)
+
+    async def _async_handle_stop(self, _event):
+        self._unsub_stop = None
+        await self.async_stop()
+
+    async def _async_run(self):
+        while not self._stopping:
+            timeout = None
+            if self._queue:
+                timeout = self._oldest + self._flush_interval - time.monotonic()
+            if timeout is None or (timeout > 0 and self._queued < self._batch_size):
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+            if self._stopping:
+                break
+            await self._async_flush()
+
+    async def _async_flush(self, force=False):
+        queue = self._queue
+        while queue:
+            full = self._queued >= self._batch_size
+            due = self._oldest is not None and time.monotonic() - self._oldest >= self._flush_interval
+            if not (force or full or due):
+                break
+            chunks = []
+            count = 0
+            while queue and (not chunks or count + queue[0][1] <= self._batch_size):
+                data, chunk_count = queue.popleft()
+                chunks.append(data)
+                count += chunk_count
+            self._queued -= count
+            # What is left starts a new batch, due a full interval from now
+            self._oldest = time.monotonic() if queue else None
+            start = time.monotonic()
+            try:
+                await self.hass.async_add_executor_job(self._write, b"".join(chunks))
+                self.written += count
+            except Exception as e:
+                self.failed += count
+                if self._metrics is not None:
+                    self._metrics.inc("influx_write_errors")
+                _LOGGER.error("[InfluxDB] Failed to write %d points to InfluxDB: %s", count, e)
+            elapsed = time.monotonic() - start
+            self._writes += 1
+            self._write_seconds += elapsed
+            if self._metrics is not None:
+                self._metrics.observe("influx_write", elapsed)
+
+    def _write(self, data):
+        self._write_api.write(bucket=self._bucket, org=self._org, record=data, write_precision="s")
+
+    def _close(self):
+        try:
+            self._write_api.close()
+            self._client.close()
+        except Exception as e:
+            _LOGGER.debug("[InfluxDB] Error closing InfluxDB client: %s", e)
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 20_000
+
+
+class LastValueCache:
+    """Bounded LRU cache of the last value written to InfluxDB.
+
+    Keys are (domain, entity_id, measurement) tuples and values are
+    (value, timestamp) pairs. A cached value of None records that InfluxDB
+    had nothing for the key, so the miss is not queried again.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Return (value, timestamp) for key, or None on a cache miss."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def peek(self, key):
+        """Return (value, timestamp) for key, or None, without counting or reordering."""
+        return self._entries.get(key)
+
+    def set(self, key, value, timestamp=None):
+        """Record a written value; older timestamps never replace newer ones."""
+        entries = self._entries
+        current = entries.get(key)
+        if current is not None and timestamp is not None and current[1] is not None and timestamp < current[1]:
+            entries.move_to_end(key)
+            return
+        entries[key] = (value, timestamp)
+        entries.move_to_end(key)
+        if len(entries) > self._max_entries:
+            entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,92 @@
+import math
+
+_MEASUREMENT_ESCAPES = str.maketrans({",": "\\,", " ": "\\ ", "\n": "\\n", "\r": "\\r", "\t": "\\t"})
+_TAG_ESCAPES = str.maketrans({",": "\\,", "=": "\\=", " ": "\\ ", "\n": "\\n", "\r": "\\r", "\t": "\\t"})
+_RESERVED_TAGS = ("domain", "entity_id")
+
+
+def escape_measurement(value):
+    return str(value).translate(_MEASUREMENT_ESCAPES)
+
+
+def escape_tag(value):
+    return str(value).translate(_TAG_ESCAPES)
+
+
+def format_field_value(value):
+    """Format a field value as line protocol, or return None if it can't be written."""
+    if isinstance(value, bool):
+        return b"true" if value else b"false"
+    if isinstance(value, int):
+        return b"%di" % value
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return None
+        return repr(value).encode()
+    if isinstance(value, str):
+        return ('"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"').encode()
+    return None
+
+
+def user_tag_items(tags):
+    """Return the user tags that are written with every point, as sorted (key, value) pairs."""
+    items = []
+    for k, v in (tags or {}).items():
+        if k in _RESERVED_TAGS:
+            continue
+        if v is not None and (not isinstance(v, str) or v.strip()):
+            items.append((str(k), v))
+    return tuple(sorted(items))
+
+
+def tag_suffix(tag_items):
+    """Escaped `,key=value` tag set for user tags, appended after domain and entity_id."""
+    return "".join(f",{escape_tag(k)}={escape_tag(v)}" for k, v in tag_items)
+
+
+class LineProtocolSerializer:
+    """Serialize single-field `value` points to InfluxDB line protocol.
+
+    The escaped measurement + tag set prefix is computed once per entity and
+    tag configuration; points are appended to a reusable buffer and taken out
+    as one bytes chunk per batch.
+    """
+
+    def __init__(self, tag_suffix=""):
+        self._tag_suffix = tag_suffix
+        self._prefixes = {}
+        self._buffer = bytearray()
+        self._count = 0
+
+    def set_tag_suffix(self, tag_suffix):
+        """Switch to a new tag configuration, dropping cached prefixes if it changed."""
+        if tag_suffix is not self._tag_suffix and tag_suffix != self._tag_suffix:
+            self._tag_suffix = tag_suffix
+            self._prefixes.clear()
+
+    def prefix(self, measurement, domain, entity_id):
+        key = (measurement, domain, entity_id)
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            prefix = f"{escape_measurement(measurement)},domain={escape_tag(domain)},entity_id={escape_tag(entity_id)}{self._tag_suffix} value=".encode()
+            self._prefixes[key] = prefix
+        return prefix
+
+    def add(self, prefix, value, timestamp):
+        """Append one point (timestamp in seconds) to the buffer; returns False if skipped."""
+        field_value = format_field_value(value)
+        if field_value is None:
+            return False
+        buffer = self._buffer
+        buffer += prefix
+        buffer += field_value
+        buffer += b" %d\n" % int(timestamp)
+        self._count += 1
+        return True
+
+    def take(self):
+        """Return (bytes, point count) for everything added since the last take."""
+        data, count = bytes(self._buffer), self._count
+        self._buffer.clear()
+        self._count = 0
+        return data, count
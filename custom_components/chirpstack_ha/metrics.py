@@ -0,0 +1,126 @@
+import time
+from bisect import bisect_left
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Pipeline stages timed by the integration
+STAGES = (
+    "decode",
+    "discovery",
+    "queue_wait",
+    "entity_creation",
+    "backfill",
+    "influx_query",
+    "influx_write",
+    "state_write",
+)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        # One count per bucket, plus one for values above the last bound
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the max for the overflow bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative_counts(self):
+        counts = []
+        cumulative = 0
+        for count in self.counts:
+            cumulative += count
+            counts.append(cumulative)
+        return counts
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.mean * 1000, 3),
+            "p50_ms": round(self.quantile(0.5) * 1000, 3),
+            "p99_ms": round(self.quantile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class Metrics:
+    """Counters and per-stage latency histograms for the uplink pipeline.
+
+    Recording is a dict lookup and a few additions on the event loop; rates
+    and quantiles are only computed when diagnostics or sensors read them.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.counters = {}
+        self.stages = {stage: Histogram() for stage in STAGES}
+        # entry_id -> counters of the uplinks routed to that config entry
+        self.entry_counters = {}
+        self._rate_marks = {}
+
+    def inc(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def inc_entry(self, entry_id, name, amount=1):
+        counters = self.entry_counters.get(entry_id)
+        if counters is None:
+            counters = self.entry_counters[entry_id] = {}
+        counters[name] = counters.get(name, 0) + amount
+
+    def observe(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.observe(seconds)
+
+    def rate(self, name, reader=None):
+        """Per-second rate of a counter since this reader's previous call."""
+        return self._rate((name, reader), self.counters.get(name, 0))
+
+    def entry_rate(self, entry_id, name):
+        """Per-second rate of a config entry's counter since the previous call for that entry."""
+        return self._rate((name, entry_id, "entry"), self.entry_counters.get(entry_id, {}).get(name, 0))
+
+    def _rate(self, key, count):
+        now = time.monotonic()
+        last_time, last_count = self._rate_marks.get(key, (self.started, 0))
+        self._rate_marks[key] = (now, count)
+        elapsed = now - last_time
+        return (count - last_count) / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        uptime = time.monotonic() - self.started
+        return {
+            "uptime_s": round(uptime, 1),
+            "counters": dict(self.counters),
+            "entry_counters": {entry_id: dict(counters) for entry_id, counters in self.entry_counters.items()},
+            "average_rates": {name: round(count / uptime, 3) for name, count in self.counters.items()} if uptime > 0 else {},
+            "stages": {stage: histogram.as_dict() for stage, histogram in self.stages.items()},
+        }
@@ -1,19 +1,17 @@
 from homeassistant.components.number import NumberEntity
+from homeassistant.helpers.restore_state import RestoreEntity
 from .const import DOMAIN
+from .discovery_store import async_restore_last_state
+from .downlink import async_queue_command, downlink_options
 
 async def async_setup_entry(hass, entry, async_add_entities):
-    numbers = {}
-
-    async def handle_event(event):
-        dev_eui = event.get("deviceInfo", {}).get("devEui")
-        device_name = event.get("deviceInfo", {}).get("deviceName")
-        data = event.get("object", {})
-        discovery_info = data.get("discovery", {})
-        downlinks = discovery_info.get("commands", [])
+    numbers = hass.data[DOMAIN]["discovery_store"].async_restore_entities(entry, "number", ChirpstackHANumber)
+
+    async def handle_event(uplink, cmd_infos):
+        dev_eui = uplink.dev_eui
+        device_name = uplink.device_name
         new_entities = []
-        for cmd_info in downlinks:
-            if cmd_info.get("type") != "number":
-                continue
+        for cmd_info in cmd_infos:
             unique_id = f"{dev_eui}_{cmd_info['field']}"
             if unique_id not in numbers:
                 number = ChirpstackHANumber(dev_eui, cmd_info, device_name)
@@ -22,10 +20,10 @@ async def async_setup_entry(hass, entry, async_add_entities):
         if new_entities:
             async_add_entities(new_entities)
 
-    hass.data[DOMAIN]["entity_callbacks"].append(handle_event)
-    async_add_entities([])
+    hass.data[DOMAIN]["dispatcher"].async_register(entry.entry_id, "number", handle_event)
+    async_add_entities(list(numbers.values()))
 
-class ChirpstackHANumber(NumberEntity):
+class ChirpstackHANumber(NumberEntity, RestoreEntity):
     def __init__(self, dev_eui, cmd_info, device_name):
         self._dev_eui = dev_eui
         self._field = cmd_info["field"]
@@ -52,6 +50,7 @@ class ChirpstackHANumber(NumberEntity):
         self._value = None
         self._pending_value = None
         self._attr_entity_registry_enabled_default = cmd_info.get("enabled_by_default", True)
+        self._f_port, self._confirmed = downlink_options(cmd_info)
 
         icon = cmd_info.get("icon")
         if icon:
@@ -72,15 +71,23 @@ class ChirpstackHANumber(NumberEntity):
         if self.hass is not None:
             self._value = value
             self.async_write_ha_state()
+            # HA passes floats; send whole numbers as integers for the codec
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            async_queue_command(self.hass, self._dev_eui, self._field, value, self._f_port, self._confirmed)
         else:
             self._pending_value = value
-        # TODO: Send downlink via MQTT
 
     async def async_added_to_hass(self):
         if self._pending_value is not None:
             self._value = self._pending_value
             self.async_write_ha_state()
-            self._pending_value = None 
+            self._pending_value = None
+            return
+        await async_restore_last_state(self, self._set_restored)
+
+    def _set_restored(self, state):
+        self._value = float(state)
 
     @property
     def unit_of_measurement(self):
@@ -0,0 +1,140 @@
+import logging
+from dataclasses import dataclass
+from types import MappingProxyType
+from .const import DEFAULT_DOWNLINK_INTERVAL, DOMAIN
+from .line_protocol import tag_suffix, user_tag_items
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def parse_tags(tags):
+    """Parse tags given as a dict, YAML (key: value) or comma-separated key=value pairs."""
+    if not tags:
+        return {}
+    if isinstance(tags, dict):
+        return tags
+    if not isinstance(tags, str):
+        return {}
+    import yaml
+
+    try:
+        parsed = yaml.safe_load(tags)
+        if not isinstance(parsed, dict):
+            raise ValueError
+        return parsed
+    except Exception:
+        # Try key=value,comma-separated
+        try:
+            return dict(item.split("=", 1) for item in tags.split(",") if "=" in item)
+        except Exception:
+            return {}
+
+
+def parse_entity_ids(value):
+    """Parse a comma-separated string or list of entity IDs into a frozenset."""
+    if not value:
+        return frozenset()
+    if isinstance(value, str):
+        value = value.split(",")
+    return frozenset(e.strip() for e in value if e and e.strip())
+
+
+def is_valid_application_id(application_id):
+    """Application IDs become an MQTT topic level, so they cannot hold wildcards or separators."""
+    return not any(c in application_id for c in "+#/")
+
+
+def parse_application_ids(value):
+    """Parse the ChirpStack application IDs an entry owns; invalid IDs are skipped."""
+    application_ids = parse_entity_ids(value)
+    invalid = {a for a in application_ids if not is_valid_application_id(a)}
+    if invalid:
+        _LOGGER.warning("Ignoring invalid application IDs: %s", sorted(invalid))
+    return application_ids - invalid
+
+
+@dataclass(frozen=True)
+class RuntimeConfig:
+    """Entry configuration compiled once per setup or options change.
+
+    Uplink handling only reads this object; nothing on the hot path parses
+    YAML or scans include/exclude lists.
+    """
+
+    version: str
+    bucket: str
+    org: str
+    database: str
+    tags: MappingProxyType
+    tag_suffix: str
+    include: frozenset
+    exclude: frozenset
+    downlink_interval: float = DEFAULT_DOWNLINK_INTERVAL
+    # Applications whose uplinks this entry handles; empty for all others
+    application_ids: frozenset = frozenset()
+    revision: int = 0
+
+    @property
+    def write_target(self):
+        """Bucket (2.x) or database (1.x) points are written to."""
+        return self.bucket if self.version == "2.x" else self.database
+
+    @property
+    def write_org(self):
+        return self.org if self.version == "2.x" else None
+
+    def is_entity_included(self, entity_id):
+        # If include entities are set, only those entities are included
+        if self.include and entity_id not in self.include:
+            return False
+        return entity_id not in self.exclude
+
+
+def build_runtime_config(entry_data, revision=0):
+    tags = parse_tags(entry_data.get("tags"))
+    include = parse_entity_ids(entry_data.get("include_entities"))
+    exclude = parse_entity_ids(entry_data.get("exclude_entities"))
+    # Legacy include/exclude: {"entities": [...]} blocks
+    include |= parse_entity_ids((entry_data.get("include") or {}).get("entities"))
+    exclude |= parse_entity_ids((entry_data.get("exclude") or {}).get("entities"))
+    return RuntimeConfig(
+        version=entry_data.get("version", "2.x"),
+        bucket=entry_data.get("bucket"),
+        org=entry_data.get("org"),
+        database=entry_data.get("database"),
+        tags=MappingProxyType(dict(tags)),
+        tag_suffix=tag_suffix(user_tag_items(tags)),
+        include=include,
+        exclude=exclude,
+        downlink_interval=float(entry_data.get("downlink_interval", DEFAULT_DOWNLINK_INTERVAL)),
+        application_ids=parse_application_ids(entry_data.get("application_ids")),
+        revision=revision,
+    )
+
+
+def async_update_runtime_config(hass, entry_id, entry_data):
+    """Compile entry data and publish it for the platforms of this entry."""
+    configs = hass.data.setdefault(DOMAIN, {}).setdefault("runtime_configs", {})
+    previous = configs.get(entry_id)
+    config = build_runtime_config(entry_data, revision=previous.revision + 1 if previous else 0)
+    configs[entry_id] = config
+    _async_apply_shared(hass, configs)
+    _LOGGER.debug("Compiled runtime config for %s (revision %d)", entry_id, config.revision)
+    return config
+
+
+def async_remove_runtime_config(hass, entry_id):
+    """Drop an unloaded entry's config and what it contributed to shared settings."""
+    configs = hass.data.get(DOMAIN, {}).get("runtime_configs", {})
+    if configs.pop(entry_id, None) is not None:
+        _async_apply_shared(hass, configs)
+
+
+def _async_apply_shared(hass, configs):
+    dispatcher = hass.data[DOMAIN].get("dispatcher")
+    if dispatcher is not None:
+        dispatcher.async_set_routes({entry_id: c.application_ids for entry_id, c in configs.items()})
+    downlinks = hass.data[DOMAIN].get("downlinks")
+    if downlinks is not None and configs:
+        # Downlinks are shared, so the strictest rate limit wins
+        downlinks.min_interval = max(c.downlink_interval for c in configs.values())
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from collections import deque
+from time import perf_counter
+from .const import DEFAULT_MAX_IN_FLIGHT_DEVICES, DEFAULT_MAX_QUEUED_PER_DEVICE, DEFAULT_MAX_QUEUED_UPLINKS
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DeviceScheduler:
+    """Runs uplinks in order per device and concurrently across devices.
+
+    Each device with pending uplinks gets one worker task that processes them
+    one after another, so a device's uplinks never overtake each other. At
+    most `max_in_flight` devices are processed at once; further devices wait
+    in arrival order for a free slot. While devices are waiting, a worker
+    hands its slot on after every uplink, so a device with a backlog cannot
+    starve the others.
+
+    Pending items are bounded. Once a device has `max_per_device` items
+    pending, or `max_queued` are pending in total, a new item is merged into
+    the device's last pending one with `coalesce(older, newer)`. If the device
+    has nothing pending to merge into and the total is reached, the item is
+    dropped.
+    """
+
+    def __init__(
+        self,
+        hass,
+        process,
+        max_in_flight=DEFAULT_MAX_IN_FLIGHT_DEVICES,
+        metrics=None,
+        coalesce=None,
+        max_per_device=DEFAULT_MAX_QUEUED_PER_DEVICE,
+        max_queued=DEFAULT_MAX_QUEUED_UPLINKS,
+    ):
+        self.hass = hass
+        self.max_in_flight = max_in_flight
+        self.max_per_device = max_per_device
+        self.max_queued = max_queued
+        self._process = process
+        self._metrics = metrics
+        self._coalesce = coalesce
+        self._queued = 0
+        # key -> deque of (item, submitted), for devices running or waiting for a slot
+        self._queues = {}
+        # Keys waiting for a slot, in arrival order
+        self._waiting = deque()
+        self._tasks = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def in_flight(self):
+        return len(self._tasks)
+
+    @property
+    def queued(self):
+        return self._queued
+
+    def as_dict(self):
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_per_device": self.max_per_device,
+            "max_queued": self.max_queued,
+            "in_flight": self.in_flight,
+            "waiting_devices": len(self._waiting),
+            "queued": self._queued,
+        }
+
+    def _inc(self, name):
+        if self._metrics is not None:
+            self._metrics.inc(name)
+
+    def submit(self, key, item):
+        """Queue item behind the key's pending items and start it when a slot frees up.
+
+        Returns False if the item was dropped.
+        """
+        queue = self._queues.get(key)
+        full = self._queued >= self.max_queued
+        if queue and self._coalesce is not None and (full or len(queue) >= self.max_per_device):
+            older, submitted = queue[-1]
+            queue[-1] = (self._coalesce(older, item), submitted)
+            self._inc("uplinks_coalesced")
+            return True
+        if full:
+            self._inc("uplinks_dropped")
+            return False
+        self._queued += 1
+        if queue is not None:
+            # The device is running or waiting for a slot; its worker picks this up in order
+            queue.append((item, perf_counter()))
+            return True
+        self._queues[key] = deque(((item, perf_counter()),))
+        self._idle.clear()
+        if len(self._tasks) < self.max_in_flight:
+            self._start(key)
+        else:
+            self._waiting.append(key)
+        return True
+
+    def _start(self, key):
+        task = self.hass.async_create_background_task(self._async_run(key), f"chirpstack_ha uplinks {key}")
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        while self._waiting and len(self._tasks) < self.max_in_flight:
+            self._start(self._waiting.popleft())
+        if not self._queues:
+            self._idle.set()
+
+    async def _async_run(self, key):
+        queue = self._queues[key]
+        try:
+            while queue:
+                item, submitted = queue.popleft()
+                self._queued -= 1
+                if self._metrics is not None:
+                    self._metrics.observe("queue_wait", perf_counter() - submitted)
+                try:
+                    await self._process(item)
+                except Exception as e:
+                    _LOGGER.exception("Error processing uplink for %s: %s", key, e)
+                if queue and self._waiting:
+                    # Let a waiting device go first; this one queues up behind it
+                    self._waiting.append(key)
+                    return
+        except asyncio.CancelledError:
+            self._queued -= len(queue)
+            queue.clear()
+            raise
+        finally:
+            if not queue and self._queues.get(key) is queue:
+                del self._queues[key]
+
+    async def async_wait_idle(self):
+        """Wait until every submitted item has been processed."""
+        await self._idle.wait()
+
+    async def async_stop(self, timeout):
+        """Let queued uplinks finish for up to timeout seconds, then cancel the rest."""
+        try:
+            async with asyncio.timeout(timeout):
+                await self.async_wait_idle()
+        except TimeoutError:
+            _LOGGER.warning("Dropping %d queued uplinks for %d devices at shutdown", self.queued, len(self._queues))
+        self._waiting.clear()
+        self._queues.clear()
+        self._queued = 0
+        for task in list(self._tasks):
+            task.cancel()
+        self._idle.set()
@@ -1,83 +1,91 @@
 import logging
 _LOGGER = logging.getLogger(__name__)
-_LOGGER.setLevel(logging.DEBUG)
 
-from homeassistant.components.sensor import SensorEntity
-from homeassistant.helpers.entity import Entity
-from .const import DOMAIN
-from homeassistant.components.recorder.statistics import async_import_statistics
+from homeassistant.components.sensor import RestoreSensor, SensorEntity
+from homeassistant.helpers.entity import EntityCategory
+from .const import DOMAIN, INFLUX_QUERY_TIMEOUT
 from homeassistant.util import dt as dt_util
-import yaml
-from influxdb_client import InfluxDBClient, Point, WritePrecision
-from homeassistant.helpers import entity_registry as er
-from .const import INFLUXDB_CONFIG
-import traceback
-from homeassistant.core import split_entity_id
+from homeassistant.core import callback, split_entity_id
 import asyncio
-from homeassistant.util import slugify
-
-# Helper to check if an entity should be included in InfluxDB
-
-def is_entity_included(entity_id, influxdb_config):
-    include = influxdb_config.get("include", {})
-    exclude = influxdb_config.get("exclude", {})
-    # If include.entities is set, only those entities are included
-    if "entities" in include:
-        if entity_id not in include["entities"]:
-            return False
-    # If exclude.entities is set, those entities are excluded
-    if "entities" in exclude:
-        if entity_id in exclude["entities"]:
-            return False
-    return True
+from time import perf_counter, time
+from .influx_writer import InfluxWriter
+from .backfill import backfill_changes, load_numpy, normalize
+from .discovery_store import async_restore_last_state
+from .filters import DEFAULT_FILTER, FilterState, change_filter_for
+from .last_value_cache import DEFAULT_MAX_ENTRIES, LastValueCache
+from .line_protocol import LineProtocolSerializer
+from .sensor_metadata import describe_sensor
+
+def create_influxdb_client(url, token, org):
+    """Return an InfluxDB client and its write API.
+
+    The client library (and NumPy for backfill) is only imported here, once an
+    InfluxDB sink is configured; run it in an executor since the import is slow.
+    """
+    from influxdb_client import InfluxDBClient
+    from influxdb_client.client.write_api import SYNCHRONOUS
+
+    load_numpy()
+    client = InfluxDBClient(url=url, token=token, org=org, timeout=5_000)
+    return client, client.write_api(write_options=SYNCHRONOUS)
+
+def flux_target(influxdb_config):
+    """Bucket and org to query with Flux.
+
+    The client talks to InfluxDB 1.8+ through its 2.x compatibility API, where
+    the bucket is the database (with its default retention policy) and the
+    org is ignored.
+    """
+    if influxdb_config.get("version", "2.x") == "2.x":
+        return influxdb_config.get("bucket"), influxdb_config.get("org")
+    return influxdb_config.get("database"), "-"
 
 async def get_last_influxdb_value(hass, influxdb_client, influxdb_config, domain_tag, entity_id_tag, measurement):
-    """Query InfluxDB for the last value for a given entity (by domain and entity_id tag) in a background thread."""
-    version = influxdb_config.get("version", "2.x")
-    bucket = influxdb_config.get("bucket")
-    org = influxdb_config.get("org")
-    database = influxdb_config.get("database")
+    """Query InfluxDB for the last value for a given entity (by domain and entity_id tag) in a background thread.
+
+    Returns None if there is no value; raises if the query fails.
+    """
+    bucket, org = flux_target(influxdb_config)
     def do_query():
+        query_api = influxdb_client.query_api()
+        flux_query = f'''from(bucket: "{bucket}")\n  |> range(start: -30d)\n  |> filter(fn: (r) => r[\"_measurement\"] == \"{measurement}\" and r[\"domain\"] == \"{domain_tag}\" and r[\"entity_id\"] == \"{entity_id_tag}\")\n  |> filter(fn: (r) => r._field == \"value\" and exists r._value and (r._value >= 0.0 or r._value < 0.0))\n  |> group()\n  |> sort(columns: [\"_time\"], desc: true)\n  |> limit(n:1)'''
+        tables = query_api.query(flux_query, org=org)
+        for table in tables:
+            for record in table.records:
+                value = record.get_value()
+                return value
+        return None
+    return await hass.async_add_executor_job(do_query)
+
+async def get_last_influxdb_values(hass, influxdb_client, influxdb_config, domain_tag, entity_id_tags):
+    """Query InfluxDB once for the last value of many entities, grouped by measurement and entity_id."""
+    bucket, org = flux_target(influxdb_config)
+    wanted = set(entity_id_tags)
+    def do_query():
+        values = {}
         try:
-            if version == "2.x":
-                query_api = influxdb_client.query_api()
-                flux_query = f'''from(bucket: "{bucket}")\n  |> range(start: -30d)\n  |> filter(fn: (r) => r[\"_measurement\"] == \"{measurement}\" and r[\"domain\"] == \"{domain_tag}\" and r[\"entity_id\"] == \"{entity_id_tag}\")\n  |> filter(fn: (r) => r._field == \"value\" and exists r._value and (r._value >= 0.0 or r._value < 0.0))\n  |> group()\n  |> sort(columns: [\"_time\"], desc: true)\n  |> limit(n:1)'''
-                tables = query_api.query(flux_query, org=org)
-                for table in tables:
-                    for record in table.records:
-                        value = record.get_value()
-                        return value
-            else:  # 1.x
-                query = f"SELECT LAST(value) FROM /.*/ WHERE \"domain\"='{domain_tag}' AND \"entity_id\"='{entity_id_tag}'"
-                result = influxdb_client.query(query, database=database)
-                for _, points in result.items():
-                    if points:
-                        return points[-1].get("last")
+            query_api = influxdb_client.query_api()
+            entity_set = ", ".join(f'"{e}"' for e in sorted(wanted))
+            flux_query = f'''from(bucket: "{bucket}")\n  |> range(start: -30d)\n  |> filter(fn: (r) => r[\"domain\"] == \"{domain_tag}\" and contains(value: r[\"entity_id\"], set: [{entity_set}]))\n  |> filter(fn: (r) => r._field == \"value\" and exists r._value and (r._value >= 0.0 or r._value < 0.0))\n  |> group(columns: [\"_measurement\", \"entity_id\"])\n  |> last()'''
+            tables = query_api.query(flux_query, org=org)
+            for table in tables:
+                for record in table.records:
+                    key = (domain_tag, record.values.get("entity_id"), record.get_measurement())
+                    values[key] = (record.get_value(), record.get_time().timestamp())
         except Exception as e:
-            _LOGGER.warning(f"[InfluxDB] Failed to query last value for {domain_tag}.{entity_id_tag}: {e}")
-        return None
+            _LOGGER.warning(f"[InfluxDB] Failed to query last values for {len(wanted)} {domain_tag} entities: {e}")
+        return values
     return await hass.async_add_executor_job(do_query)
 
 async def async_setup_entry(hass, entry, async_add_entities):
-    sensors = {}
-    entity_reg = er.async_get(hass)
-    # Repopulate sensors dict and mapping from entity registry
-    for entity in entity_reg.entities.values():
-        if entity.domain == "sensor" and entity.platform == DOMAIN and entity.config_entry_id == entry.entry_id:
-            object_id = entity.entity_id.split(".", 1)[1]  # <dev_eui>_<field>
-            dev_eui, _, field = object_id.partition("_")
-            device_name = entity.original_name.split(" ")[0] if entity.original_name else dev_eui
-            if object_id not in sensors:
-                sensor_info = {"field": field}
-                sensor = ChirpstackHASensor(dev_eui, sensor_info, device_name)
-                sensor.entity_id = entity.entity_id
-                sensors[object_id] = sensor
+    sensors = hass.data[DOMAIN]["discovery_store"].async_restore_entities(entry, "sensor", ChirpstackHASensor)
     # Prepare pending history storage
     # hass.data[DOMAIN].setdefault("pending_history", {})
     # Get latest config from hass.data for this entry
     domain_data = hass.data.get(DOMAIN, {})
     entry_data = domain_data.get(entry.entry_id, entry.data)
-    _LOGGER.debug(f"[InfluxDB] entry_data at setup: {mask_secrets(entry_data)}")
+    if _LOGGER.isEnabledFor(logging.DEBUG):
+        _LOGGER.debug("[InfluxDB] entry_data at setup: %s", mask_secrets(entry_data))
     influxdb_config = entry_data  # Use the whole config entry data dict
     influxdb_client = None
     influxdb_write_api = None
@@ -94,11 +102,10 @@ async def async_setup_entry(hass, entry, async_add_entities):
             try:
                 url = f"http://{influxdb_config.get('host')}:{influxdb_config.get('port', 8086)}"
                 _LOGGER.debug(f"[InfluxDB] Attempting to initialize v2 client with url={url}, org={org}, bucket={bucket}, token={'set' if token else 'not set'}")
-                influxdb_client = InfluxDBClient(url=url, token=token, org=org, timeout=5_000)
-                influxdb_write_api = influxdb_client.write_api()
+                influxdb_client, influxdb_write_api = await hass.async_add_executor_job(create_influxdb_client, url, token, org)
                 _LOGGER.debug(f"[InfluxDB] v2 client initialized successfully.")
             except Exception as e:
-                _LOGGER.error(f"[InfluxDB] Failed to initialize InfluxDB v2 client: {e} | config: url={url}, org={org}, bucket={bucket}, token={'set' if token else 'not set'}\n{traceback.format_exc()}")
+                _LOGGER.error(f"[InfluxDB] Failed to initialize InfluxDB v2 client: {e} | config: url={url}, org={org}, bucket={bucket}, token={'set' if token else 'not set'}", exc_info=True)
                 influxdb_client = None
                 influxdb_write_api = None
     elif version == "1.x":
@@ -111,163 +118,228 @@ async def async_setup_entry(hass, entry, async_add_entities):
                 username = influxdb_config.get("username")
                 password = influxdb_config.get("password")
                 _LOGGER.debug(f"[InfluxDB] Attempting to initialize v1 client with url={url}, database={database}, username={username}, password={'set' if password else 'not set'}")
-                influxdb_client = InfluxDBClient(url=url, token=password, org=username, timeout=5_000)
-                influxdb_write_api = influxdb_client.write_api()
+                # The 1.8+ compatibility API takes "username:password" as the token and ignores the org
+                token = f"{username}:{password}" if username else password
+                influxdb_client, influxdb_write_api = await hass.async_add_executor_job(create_influxdb_client, url, token, "-")
                 _LOGGER.debug(f"[InfluxDB] v1 client initialized successfully.")
             except Exception as e:
-                _LOGGER.error(f"[InfluxDB] Failed to initialize InfluxDB v1 client: {e} | config: url={url}, database={database}, username={username}, password={'set' if password else 'not set'}\n{traceback.format_exc()}")
+                _LOGGER.error(f"[InfluxDB] Failed to initialize InfluxDB v1 client: {e} | config: url={url}, database={database}, username={username}, password={'set' if password else 'not set'}", exc_info=True)
                 influxdb_client = None
                 influxdb_write_api = None
     else:
         _LOGGER.warning(f"[InfluxDB] Unknown InfluxDB version: {version}; skipping InfluxDB initialization.")
 
-    async def handle_event(event, entry_id):
-        # Always fetch the latest config for this entry
-        domain_data = hass.data.get(DOMAIN, {})
-        entry_data = domain_data.get(entry_id, {})
-        influxdb_config = entry_data  # Use the whole config entry data dict
-        dev_eui = event.get("deviceInfo", {}).get("devEui")
-        device_name = event.get("deviceInfo", {}).get("deviceName")
-        data = event.get("object", {})
-        discovery_info = data.get("discovery", {})
-        discovery = discovery_info.get("sensors", [])
-        history = data.get("history", [])
-        _LOGGER.debug(f"[InfluxDB] Received history for {device_name} ({dev_eui}): {history}")
-        # --- Normalize tags ---
-        tags = influxdb_config.get("tags")
-        if not tags:
-            tags = {}
-        elif isinstance(tags, str):
-            try:
-                tags = yaml.safe_load(tags)
-                if not isinstance(tags, dict):
-                    raise ValueError
-            except Exception:
-                # Try key=value,comma-separated
-                try:
-                    tags = dict(
-                        item.split("=", 1) for item in tags.split(",") if "=" in item
-                    )
-                except Exception:
-                    tags = {}
-        elif not isinstance(tags, dict):
-            tags = {}
-        # --- End normalize tags ---
-        new_entities = []
-        # First, ensure all sensors exist and are added if missing
-        for sensor_info in discovery:
-            field = sensor_info["field"]
-            unique_id = f"{dev_eui}_{field}"
-            entity = next(
-                (e for e in entity_reg.entities.values()
-                 if e.domain == "sensor" and e.platform == DOMAIN and e.unique_id == unique_id and e.config_entry_id == entry_id),
-                None
-            )
-            if unique_id in sensors:
-                sensor = sensors[unique_id]
+    runtime_configs = hass.data[DOMAIN]["runtime_configs"]
+    metrics = hass.data[DOMAIN]["metrics"]
+    # Points are queued here and written in batches off the event loop
+    influxdb_writer = None
+    if influxdb_write_api:
+        influxdb_writer = InfluxWriter(
+            hass,
+            influxdb_client,
+            influxdb_write_api,
+            bucket=runtime_configs[entry.entry_id].write_target,
+            org=runtime_configs[entry.entry_id].write_org,
+            metrics=metrics,
+        )
+        influxdb_writer.async_start()
+        hass.data[DOMAIN].setdefault("influxdb_writers", {})[entry.entry_id] = influxdb_writer
+    # Escaped measurement/tag prefixes are cached per entity and tag configuration
+    serializer = LineProtocolSerializer()
+
+    # Last value written per (domain, entity_id, measurement); Influx is only queried on a miss
+    # Sized so the startup warm-up never evicts its own results
+    last_values = LastValueCache(max_entries=max(DEFAULT_MAX_ENTRIES, 2 * len(sensors)))
+
+    async def async_query_last_value(key):
+        start = perf_counter()
+        try:
+            value = await get_last_influxdb_value(hass, influxdb_client, influxdb_config, *key)
+        except Exception as e:
+            # Unknown, not cached, so the next uplink queries again
+            metrics.inc("influx_query_errors")
+            _LOGGER.warning("[InfluxDB] Failed to query last value for %s.%s: %s", key[0], key[1], e)
+            return None
+        metrics.observe("influx_query", perf_counter() - start)
+        last_values.set(key, value)
+        return value
+
+    async def async_get_last_values(lookups):
+        """Return {field: last value} for [(field, (domain, entity_id, measurement))].
+
+        Cache misses are queried concurrently, and the warm-up wait and all
+        queries share one INFLUX_QUERY_TIMEOUT deadline. Values still unknown
+        then are None and not cached: history is written in full, which
+        InfluxDB deduplicates by timestamp.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + INFLUX_QUERY_TIMEOUT
+        if warm_up_task is not None and not warm_up_task.done():
+            # Bounded, so a slow InfluxDB at startup falls back to per-entity lookups
+            await asyncio.wait([warm_up_task], timeout=INFLUX_QUERY_TIMEOUT / 2)
+        values = {}
+        queries = {}
+        for field, key in lookups:
+            cached = last_values.get(key)
+            if cached is not None:
+                values[field] = cached[0]
             else:
-                sensor = ChirpstackHASensor(dev_eui, sensor_info, device_name)
-                sensors[unique_id] = sensor
-                new_entities.append(sensor)
+                queries[field] = asyncio.create_task(async_query_last_value(key))
+        if not queries:
+            return values
+        done, pending = await asyncio.wait(queries.values(), timeout=max(0.0, deadline - loop.time()))
+        for task in pending:
+            task.cancel()
+        if pending:
+            metrics.inc("influx_query_timeouts", len(pending))
+            _LOGGER.warning("[InfluxDB] %d of %d last value lookups timed out", len(pending), len(queries))
+        for field, task in queries.items():
+            values[field] = task.result() if task in done else None
+        return values
+
+    async def async_warm_up_last_values():
+        entity_id_tags = [sensor.entity_id.split(".", 1)[1] for sensor in sensors.values() if sensor.entity_id]
+        if not entity_id_tags:
+            return
+        start = perf_counter()
+        values = await get_last_influxdb_values(hass, influxdb_client, influxdb_config, "sensor", entity_id_tags)
+        metrics.observe("influx_query", perf_counter() - start)
+        for key, (value, timestamp) in values.items():
+            last_values.set(key, value, timestamp)
+        _LOGGER.debug("[InfluxDB] Warmed up last values for %d of %d sensors", len(values), len(entity_id_tags))
+
+    # Pre-populate the dedup cache with one grouped query instead of one query per sensor
+    warm_up_task = None
+    if influxdb_client:
+        warm_up_task = hass.async_create_background_task(async_warm_up_last_values(), "chirpstack_ha influxdb warm-up")
+
+    entity_index = hass.data[DOMAIN]["entity_index"]
+
+    # Filter state of the last value written to HA, per device and field
+    device_values = {}
+
+    async def handle_event(uplink, discovery, entry_id=entry.entry_id):
+        # Compiled when the entry is set up or its options change
+        config = runtime_configs[entry_id]
+        dev_eui = uplink.dev_eui
+        device_name = uplink.device_name
+        data = uplink.values
+        history = uplink.history
+        _LOGGER.debug("[InfluxDB] Received history for %s (%s): %s", device_name, dev_eui, history)
+        if influxdb_writer:
+            serializer.set_tag_suffix(config.tag_suffix)
+        new_entities = []
+        start = perf_counter()
+        # Ensure all sensors exist, only when the device's discovery block changed
+        if uplink.discovery_changed:
+            # New or renamed entities need their first state, whatever the previous values
+            device_values.pop(dev_eui, None)
+            for sensor_info in discovery:
+                field = sensor_info["field"]
+                unique_id = f"{dev_eui}_{field}"
+                if unique_id not in sensors:
+                    sensor = ChirpstackHASensor(dev_eui, sensor_info, device_name)
+                    sensors[unique_id] = sensor
+                    new_entities.append(sensor)
         if new_entities:
             async_add_entities(new_entities)
+            metrics.observe("entity_creation", perf_counter() - start)
+            metrics.inc("entities_created", len(new_entities))
             await asyncio.sleep(0.1)
-            entity_reg_latest = er.async_get(hass)
-        else:
-            entity_reg_latest = entity_reg
-        # Now process history for all sensors
+        # Resolve registry entries; states are written before any InfluxDB lookup
+        resolved = []
+        lookups = []
         for sensor_info in discovery:
             field = sensor_info["field"]
             unique_id = f"{dev_eui}_{field}"
-            entity = next(
-                (e for e in entity_reg_latest.entities.values()
-                 if e.domain == "sensor" and e.platform == DOMAIN and e.unique_id == unique_id and e.config_entry_id == entry_id),
-                None
-            )
-            if entity:
-                entity_id = entity.entity_id
-                sensor = sensors[unique_id]
-                included = is_entity_included(entity_id, influxdb_config)
-                state_class = getattr(sensor, "state_class", None)
-                has_history = bool(history)
-                if state_class == "measurement" and has_history:
-                    domain_tag, object_id_tag = split_entity_id(entity_id)
-                    last_value = await get_last_influxdb_value(hass, influxdb_client, influxdb_config, domain_tag, object_id_tag, sensor_info.get("unit")) if influxdb_client else None
-                    def normalize(v):
-                        try:
-                            return float(v)
-                        except (TypeError, ValueError):
-                            return v
-                    prev_value = normalize(last_value)
-                    influx_points = []
-                    for entry in history:
-                        if field in entry:
-                            value = entry[field]
-                            ts = entry.get("timestamp")
-                            if ts is not None:
-                                norm_value = normalize(value)
-                                diff = abs(norm_value - prev_value) if isinstance(norm_value, float) and isinstance(prev_value, float) else None
-                                if (isinstance(norm_value, float) and isinstance(prev_value, float) and diff > 1e-6) or (not isinstance(norm_value, float) or not isinstance(prev_value, float)) and norm_value != prev_value:
-                                    dt = dt_util.utc_from_timestamp(float(ts))
-                                    if influxdb_write_api and included:
-                                        domain_tag, object_id_tag = split_entity_id(sensor.entity_id)
-                                        point = (
-                                            Point(sensor_info.get("unit"))
-                                            .tag("domain", domain_tag)
-                                            .tag("entity_id", object_id_tag)
-                                            .field("value", value)
-                                            .time(dt, WritePrecision.S)
-                                        )
-                                        for k, v in tags.items():
-                                            if k in ("entity_id", "domain"):
-                                                continue
-                                            if v is not None and (not isinstance(v, str) or v.strip()):
-                                                point = point.tag(k, v)
-                                        influx_points.append(point)
-                                    prev_value = norm_value
-                    if influx_points and influxdb_write_api:
-                        try:
-                            influxdb_write_api.write(bucket=bucket if version == '2.x' else database, org=org if version == '2.x' else None, record=influx_points)
-                            influxdb_write_api.flush()
-                        except Exception as e:
-                            _LOGGER.error(f"[InfluxDB] Failed to write to InfluxDB: {e}\n{traceback.format_exc()}")
-                    elif influxdb_write_api:
-                        _LOGGER.debug(f"[InfluxDB] No points to write for {entity_id} (history empty or not included)")
-                    current_value = data.get(field)
-                    if (
-                        current_value is not None
-                        and last_value == current_value
-                        and prev_value != current_value
-                        and influx_points
-                    ):
-                        dt = dt_util.utcnow()
-                        if influxdb_write_api and included:
-                            domain_tag, object_id_tag = split_entity_id(sensor.entity_id)
-                            point = (
-                                Point(sensor_info.get("unit"))
-                                .tag("domain", domain_tag)
-                                .tag("entity_id", object_id_tag)
-                                .field("value", current_value)
-                                .time(dt, WritePrecision.S)
-                            )
-                            for k, v in tags.items():
-                                if v is not None and (not isinstance(v, str) or v.strip()):
-                                    point = point.tag(k, v)
-                            try:
-                                influxdb_write_api.write(bucket=bucket if version == '2.x' else database, org=org if version == '2.x' else None, record=[point])
-                                influxdb_write_api.flush()
-                            except Exception as e:
-                                _LOGGER.error(f"[InfluxDB] Failed to write current value after backfill: {e}\n{traceback.format_exc()}")
-                # Always update state for every event
-                value = data.get(field)
-                if value is not None:
-                    await sensor.async_update_state(value)
-            else:
+            entity_id = entity_index.get(entry_id, "sensor", unique_id)
+            if not entity_id or unique_id not in sensors:
                 _LOGGER.debug(f"[InfluxDB] Skipping history for {unique_id} because entity_id is not in registry.")
+                continue
+            sensor = sensors[unique_id]
+            resolved.append((sensor_info, sensor, entity_id))
+            # History is only backfilled into InfluxDB, so without it there is nothing to compute
+            if influxdb_client and history and getattr(sensor, "state_class", None) == "measurement":
+                domain_tag, object_id_tag = split_entity_id(entity_id)
+                lookups.append((field, (domain_tag, object_id_tag, sensor_info.get("unit"))))
+        states = device_values.setdefault(dev_eui, {})
+        now = time()
+        changed = []
+        skipped = 0
+        for sensor_info, sensor, entity_id in resolved:
+            # Only values the sensor's filter keeps get a state write
+            value = data.get(sensor_info["field"])
+            if value is None:
+                continue
+            state = states.get(sensor_info["field"])
+            if state is None:
+                state = states[sensor_info["field"]] = FilterState()
+            if not change_filter_for(sensor_info).accept(state, value, now):
+                skipped += 1
+                continue
+            changed.append((sensor, value))
+        if skipped:
+            metrics.inc("state_writes_skipped", skipped)
+        if changed:
+            # Flush the uplink's state changes together, without yielding in between
+            start = perf_counter()
+            for sensor, value in changed:
+                sensor.async_set_state(value)
+            metrics.observe("state_write", perf_counter() - start)
+            metrics.inc("state_writes", len(changed))
+        if not lookups:
+            return
+        # Collect the last stored value for every backfill candidate
+        last_influx_values = await async_get_last_values(lookups)
+        # Deduplicate the history of all fields of the device in one columnar pass
+        start = perf_counter()
+        changes = backfill_changes(history, last_influx_values)
+        metrics.observe("backfill", perf_counter() - start)
+        for sensor_info, sensor, entity_id in resolved:
+            field = sensor_info["field"]
+            if field not in changes:
+                continue
+            change_filter = change_filter_for(sensor_info)
+            included = config.is_entity_included(entity_id)
+            last_value = last_influx_values[field]
+            backfill_points, prev_value = changes[field]
+            domain_tag, object_id_tag = split_entity_id(entity_id)
+            measurement = sensor_info.get("unit")
+            if change_filter is not DEFAULT_FILTER and backfill_points:
+                # Continue from the last point written, which the cache keeps per entity
+                cached = last_values.peek((domain_tag, object_id_tag, measurement))
+                state = FilterState(*cached) if cached and cached[0] is not None else FilterState()
+                kept = [point for point in backfill_points if change_filter.accept(state, point[1], point[0])]
+                if len(kept) < len(backfill_points):
+                    metrics.inc("influx_points_filtered", len(backfill_points) - len(kept))
+                    backfill_points = kept
+                    if kept:
+                        prev_value = normalize(state.value)
+            written = 0
+            if influxdb_writer and included:
+                prefix = serializer.prefix(measurement, domain_tag, object_id_tag)
+                for ts, value in backfill_points:
+                    written += serializer.add(prefix, value, ts)
+            if written:
+                last_ts, last_written = max(backfill_points, key=lambda p: p[0])
+                last_values.set((domain_tag, object_id_tag, measurement), last_written, last_ts)
+            elif influxdb_writer:
+                _LOGGER.debug(f"[InfluxDB] No points to write for {entity_id} (history empty or not included)")
+            current_value = data.get(field)
+            if (
+                current_value is not None
+                and last_value == current_value
+                and prev_value != current_value
+                and written
+            ):
+                dt = dt_util.utcnow()
+                serializer.add(prefix, current_value, dt.timestamp())
+                last_values.set((domain_tag, object_id_tag, measurement), current_value, dt.timestamp())
+        if influxdb_writer:
+            chunk, count = serializer.take()
+            influxdb_writer.async_enqueue(chunk, count)
         # Update last value for live updates
         # last_values[entity_id_tag] = current_value
-        if new_entities:
-            async_add_entities(new_entities)
 
     # For live updates, only write if value changes
     # live_last_values = {}
@@ -307,120 +379,29 @@ async def async_setup_entry(hass, entry, async_add_entities):
     # ChirpstackHASensor.async_update_state = patched_async_update_state
 
     # Register callback
-    hass.data[DOMAIN]["entity_callbacks"].append(lambda event, entry_id=entry.entry_id: handle_event(event, entry_id))
-    async_add_entities([])  # No entities at startup
+    hass.data[DOMAIN]["dispatcher"].async_register(entry.entry_id, "sensor", handle_event)
+    entities = list(sensors.values())
+    if entry_data.get("diagnostic_sensors"):
+        entities.extend(create_metric_sensors(entry.entry_id, metrics, influxdb_writer))
+    async_add_entities(entities)
 
-class ChirpstackHASensor(SensorEntity):
+class ChirpstackHASensor(RestoreSensor):
     def __init__(self, dev_eui, sensor_info, device_name):
         self._dev_eui = dev_eui
         self._field = sensor_info["field"]
         self._attr_unique_id = f"{dev_eui}_{self._field}"
         sensor_name = sensor_info.get("name", self._field)
         self._attr_name = f"{device_name} {sensor_name}"
-        _LOGGER.debug(f"sensor_info for {self._attr_name}: {sensor_info}")
-        unit = sensor_info.get("unit")
-        device_class = sensor_info.get("device_class")
-        # Fallbacks for missing or unrecognized units
-        if not unit:
-            # Try to infer from device_class or field name
-            if device_class == "temperature" or "temperature" in self._field:
-                unit = "°C"
-                _LOGGER.warning(f"No unit provided for {self._attr_name} ({self._field}), defaulting to '°C' for temperature.")
-            elif device_class == "weight" or "weight" in self._field:
-                unit = "kg"
-                _LOGGER.warning(f"No unit provided for {self._attr_name} ({self._field}), defaulting to 'kg' for weight.")
-            elif device_class == "humidity" or "humidity" in self._field:
-                unit = "%"
-                _LOGGER.warning(f"No unit provided for {self._attr_name} ({self._field}), defaulting to '%' for humidity.")
-            elif device_class == "battery" or "battery" in self._field:
-                unit = "%"
-                _LOGGER.warning(f"No unit provided for {self._attr_name} ({self._field}), defaulting to '%' for battery.")
-            elif device_class == "pressure" or "pressure" in self._field:
-                unit = "hPa"
-                _LOGGER.warning(f"No unit provided for {self._attr_name} ({self._field}), defaulting to 'hPa' for pressure.")
-            elif device_class == "voltage" or "voltage" in self._field:
-                unit = "V"
-                _LOGGER.warning(f"No unit provided for {self._attr_name} ({self._field}), defaulting to 'V' for voltage.")
-            elif device_class == "current" or "current" in self._field:
-                unit = "A"
-                _LOGGER.warning(f"No unit provided for {self._attr_name} ({self._field}), defaulting to 'A' for current.")
-            elif device_class == "power" or "power" in self._field:
-                unit = "W"
-                _LOGGER.warning(f"No unit provided for {self._attr_name} ({self._field}), defaulting to 'W' for power.")
-            elif device_class == "energy" or "energy" in self._field:
-                unit = "Wh"
-                _LOGGER.warning(f"No unit provided for {self._attr_name} ({self._field}), defaulting to 'Wh' for energy.")
-            else:
-                unit = None
-                _LOGGER.warning(f"No unit provided for {self._attr_name} ({self._field}), and could not infer a default.")
-        # Normalize units for Home Assistant compatibility
-        if device_class == "temperature":
-            if unit in ["°C", "℃", "C", "c"]:
-                unit = "\u00B0C"
-            elif unit in ["°F", "F", "f"]:
-                unit = "\u00B0F"
-        # For Home Assistant compatibility, use device_class 'mass' instead of 'weight'
-        if device_class == "weight" or (not device_class and "weight" in self._field):
-            device_class = "mass"
-        # Log the actual unit and device_class values for debugging
-        _LOGGER.debug(f"Normalized unit for {self._attr_name}: {repr(unit)}, device_class: {device_class}")
-        # Validate unit for known device classes after normalization
-        valid_units = {
-            "temperature": ["\u00B0C", "\u00B0F"],
-            "mass": ["kg", "g", "lb"],
-            "humidity": ["%"],
-            "battery": ["%"],
-            "pressure": ["hPa", "Pa", "mbar", "bar", "psi"],
-            "voltage": ["V", "mV"],
-            "current": ["A", "mA"],
-            "power": ["W", "kW"],
-            "energy": ["Wh", "kWh"],
-        }
-        if device_class in valid_units and unit not in valid_units[device_class]:
-            _LOGGER.warning(f"After normalization, unit '{unit}' for {self._attr_name} ({self._field}) is not recognized for device_class '{device_class}'. Valid units: {valid_units[device_class]}")
-        self._attr_unit_of_measurement = unit
-        self._attr_native_unit_of_measurement = unit
-        # Device class
-        if device_class:
-            self._attr_device_class = device_class
-        elif "weight" in self._field:
-            self._attr_device_class = "mass"
-        elif "temperature" in self._field:
-            self._attr_device_class = "temperature"
-        elif "humidity" in self._field:
-            self._attr_device_class = "humidity"
-        elif "pressure" in self._field:
-            self._attr_device_class = "pressure"
-        elif "voltage" in self._field:
-            self._attr_device_class = "voltage"
-        elif "current" in self._field:
-            self._attr_device_class = "current"
-        elif "power" in self._field:
-            self._attr_device_class = "power"
-        elif "energy" in self._field:
-            self._attr_device_class = "energy"
-        elif "battery" in self._field:
-            self._attr_device_class = "battery"
-        elif "signal" in self._field:
-            self._attr_device_class = "signal"
-        elif "rssi" in self._field:
-            self._attr_device_class = "rssi"
-        elif "snr" in self._field:
-            self._attr_device_class = "snr"
-        elif "co2" in self._field:
-            self._attr_device_class = "co2"
-        elif "co" in self._field:
-            self._attr_device_class = "co"
-        elif "no2" in self._field:
-            self._attr_device_class = "no2"
-        else:
-            self._attr_device_class = None
-        # State class
-        self._attr_state_class = sensor_info.get("state_class", "measurement")
+        # Units, device class and state class resolved from shared lookup tables
+        descriptor = describe_sensor(sensor_info)
+        self._descriptor = descriptor
+        self._attr_unit_of_measurement = descriptor.unit
+        self._attr_native_unit_of_measurement = descriptor.unit
+        self._attr_device_class = descriptor.device_class
+        self._attr_state_class = descriptor.state_class
         # Suggested display precision
-        precision = sensor_info.get("precision")
-        if precision is not None:
-            self._attr_suggested_display_precision = int(precision)
+        if descriptor.precision is not None:
+            self._attr_suggested_display_precision = descriptor.precision
         # Icon
         icon = sensor_info.get("icon")
         if icon:
@@ -443,26 +424,39 @@ class ChirpstackHASensor(SensorEntity):
             "manufacturer": "ChirpStack",
             "model": "LoRaWAN Device",
         }
-        # Only log at creation for troubleshooting (after all attributes are set)
-        _LOGGER.debug(f"Creating sensor {self._attr_name}: field={self._field}, device_class={self._attr_device_class}, state_class={self._attr_state_class}, precision={getattr(self, '_attr_suggested_display_precision', None)}, unit={self._attr_unit_of_measurement}, icon={getattr(self, '_attr_icon', None)}, entity_category={getattr(self, '_attr_entity_category', None)}")
+        _LOGGER.debug("Creating sensor %s: %s", self._attr_name, descriptor)
 
     @property
     def state(self):
         return self._state
 
-    async def async_update_state(self, value):
+    @property
+    def native_value(self):
+        # Saved by RestoreSensor and restored in async_added_to_hass
+        return self._state
+
+    @callback
+    def async_set_state(self, value):
         if self.hass is not None:
             self._state = value
             self.async_write_ha_state()
         else:
             self._pending_state = value
 
+    async def async_update_state(self, value):
+        self.async_set_state(value)
+
     async def async_added_to_hass(self):
         _LOGGER.debug(f"[InfluxDB] async_added_to_hass called for {self._attr_unique_id} (entity_id={getattr(self, 'entity_id', None)})")
         if self._pending_state is not None:
             self._state = self._pending_state
             self.async_write_ha_state()
             self._pending_state = None
+            return
+        await async_restore_last_state(self, self._set_restored)
+
+    def _set_restored(self, value):
+        self._state = value
 
     @property
     def unit_of_measurement(self):
@@ -493,6 +487,40 @@ class ChirpstackHASensor(SensorEntity):
         return self._attr_suggested_display_precision
 
 
+class ChirpstackHAMetricSensor(SensorEntity):
+    """Diagnostic sensor polling one value from the integration's metrics."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class = "measurement"
+    _attr_should_poll = True
+
+    def __init__(self, entry_id, key, name, unit, read):
+        self._attr_unique_id = f"{entry_id}_{key}"
+        self._attr_name = f"ChirpStack HA {name}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_native_value = None
+        self._read = read
+        self._attr_device_info = {
+            "identifiers": {(DOMAIN, entry_id)},
+            "name": "ChirpStack HA",
+            "manufacturer": "ChirpStack",
+            "model": "Integration",
+        }
+
+    async def async_update(self):
+        self._attr_native_value = self._read()
+
+
+def create_metric_sensors(entry_id, metrics, influxdb_writer):
+    sensors = [
+        ChirpstackHAMetricSensor(entry_id, "messages_per_second", "Messages per second", "msg/s", lambda: round(metrics.entry_rate(entry_id, "messages"), 2)),
+    ]
+    if influxdb_writer is not None:
+        sensors.append(ChirpstackHAMetricSensor(entry_id, "influx_queue_depth", "InfluxDB queue depth", "points", lambda: influxdb_writer.queue_depth))
+        sensors.append(ChirpstackHAMetricSensor(entry_id, "influx_write_latency", "InfluxDB write latency", "ms", lambda: round(influxdb_writer.recent_write_latency() * 1000, 1)))
+    return sensors
+
+
 def create_sensor(dev_eui, sensor_info, device_name):
     return ChirpstackHASensor(dev_eui, sensor_info, device_name) 
 
@@ -0,0 +1,114 @@
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+
+_LOGGER = logging.getLogger(__name__)
+
+# (device class / field keyword, default unit) used when the codec gives no unit
+DEFAULT_UNITS = (
+    ("temperature", "°C"),
+    ("weight", "kg"),
+    ("humidity", "%"),
+    ("battery", "%"),
+    ("pressure", "hPa"),
+    ("voltage", "V"),
+    ("current", "A"),
+    ("power", "W"),
+    ("energy", "Wh"),
+)
+
+TEMPERATURE_UNITS = {
+    "°C": "°C",
+    "℃": "°C",
+    "C": "°C",
+    "c": "°C",
+    "°F": "°F",
+    "F": "°F",
+    "f": "°F",
+}
+
+VALID_UNITS = {
+    "temperature": frozenset(["°C", "°F"]),
+    "mass": frozenset(["kg", "g", "lb"]),
+    "humidity": frozenset(["%"]),
+    "battery": frozenset(["%"]),
+    "pressure": frozenset(["hPa", "Pa", "mbar", "bar", "psi"]),
+    "voltage": frozenset(["V", "mV"]),
+    "current": frozenset(["A", "mA"]),
+    "power": frozenset(["W", "kW"]),
+    "energy": frozenset(["Wh", "kWh"]),
+}
+
+# Field name keyword -> device class, checked in order when the codec gives none
+FIELD_DEVICE_CLASSES = (
+    ("weight", "mass"),
+    ("temperature", "temperature"),
+    ("humidity", "humidity"),
+    ("pressure", "pressure"),
+    ("voltage", "voltage"),
+    ("current", "current"),
+    ("power", "power"),
+    ("energy", "energy"),
+    ("battery", "battery"),
+    ("signal", "signal"),
+    ("rssi", "rssi"),
+    ("snr", "snr"),
+    ("co2", "co2"),
+    ("co", "co"),
+    ("no2", "no2"),
+)
+
+
+@dataclass(frozen=True)
+class SensorDescriptor:
+    """Resolved, immutable sensor metadata shared by all entities with the same spec."""
+
+    unit: str
+    device_class: str
+    state_class: str
+    precision: int
+
+
+def describe_sensor(sensor_info):
+    """Resolve the descriptor for a discovery sensor spec."""
+    return resolve_sensor_metadata(
+        sensor_info["field"],
+        sensor_info.get("device_class"),
+        sensor_info.get("unit"),
+        sensor_info.get("state_class", "measurement"),
+        sensor_info.get("precision"),
+    )
+
+
+@lru_cache(maxsize=4096)
+def resolve_sensor_metadata(field, device_class, unit, state_class, precision):
+    # Fallbacks for missing or unrecognized units
+    if not unit:
+        for keyword, default_unit in DEFAULT_UNITS:
+            if device_class == keyword or keyword in field:
+                unit = default_unit
+                _LOGGER.warning("No unit provided for field %s, defaulting to %r for %s.", field, unit, keyword)
+                break
+        else:
+            unit = None
+            _LOGGER.warning("No unit provided for field %s, and could not infer a default.", field)
+    # Normalize units for Home Assistant compatibility
+    if device_class == "temperature":
+        unit = TEMPERATURE_UNITS.get(unit, unit)
+    # For Home Assistant compatibility, use device_class 'mass' instead of 'weight'
+    if device_class == "weight" or (not device_class and "weight" in field):
+        device_class = "mass"
+    valid_units = VALID_UNITS.get(device_class)
+    if valid_units is not None and unit not in valid_units:
+        _LOGGER.warning(
+            "After normalization, unit %r for field %s is not recognized for device_class %r. Valid units: %s",
+            unit, field, device_class, sorted(valid_units),
+        )
+    if not device_class:
+        device_class = next((dc for keyword, dc in FIELD_DEVICE_CLASSES if keyword in field), None)
+    return SensorDescriptor(
+        unit=unit,
+        device_class=device_class,
+        state_class=state_class,
+        precision=int(precision) if precision is not None else None,
+    )
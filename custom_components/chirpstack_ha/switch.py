@@ -1,19 +1,18 @@
 from homeassistant.components.switch import SwitchEntity
+from homeassistant.const import STATE_OFF, STATE_ON
+from homeassistant.helpers.restore_state import RestoreEntity
 from .const import DOMAIN
+from .discovery_store import async_restore_last_state
+from .downlink import async_queue_command, downlink_options
 
 async def async_setup_entry(hass, entry, async_add_entities):
-    switches = {}
+    switches = hass.data[DOMAIN]["discovery_store"].async_restore_entities(entry, "switch", ChirpstackHASwitch)
 
-    async def handle_event(event):
-        dev_eui = event.get("deviceInfo", {}).get("devEui")
-        device_name = event.get("deviceInfo", {}).get("deviceName")
-        data = event.get("object", {})
-        discovery_info = data.get("discovery", {})
-        downlinks = discovery_info.get("commands", [])
+    async def handle_event(uplink, cmd_infos):
+        dev_eui = uplink.dev_eui
+        device_name = uplink.device_name
         new_entities = []
-        for cmd_info in downlinks:
-            if cmd_info.get("type") != "switch":
-                continue
+        for cmd_info in cmd_infos:
             unique_id = f"{dev_eui}_{cmd_info['field']}"
             if unique_id not in switches:
                 switch = ChirpstackHASwitch(dev_eui, cmd_info, device_name)
@@ -22,10 +21,10 @@ async def async_setup_entry(hass, entry, async_add_entities):
         if new_entities:
             async_add_entities(new_entities)
 
-    hass.data[DOMAIN]["entity_callbacks"].append(handle_event)
-    async_add_entities([])
+    hass.data[DOMAIN]["dispatcher"].async_register(entry.entry_id, "switch", handle_event)
+    async_add_entities(list(switches.values()))
 
-class ChirpstackHASwitch(SwitchEntity):
+class ChirpstackHASwitch(SwitchEntity, RestoreEntity):
     def __init__(self, dev_eui, cmd_info, device_name):
         self._dev_eui = dev_eui
         self._field = cmd_info["field"]
@@ -44,6 +43,7 @@ class ChirpstackHASwitch(SwitchEntity):
         self._is_on = False
         self._pending_state = None
         self._attr_entity_registry_enabled_default = cmd_info.get("enabled_by_default", True)
+        self._f_port, self._confirmed = downlink_options(cmd_info)
 
         icon = cmd_info.get("icon")
         if icon:
@@ -64,23 +64,30 @@ class ChirpstackHASwitch(SwitchEntity):
         if self.hass is not None:
             self._is_on = True
             self.async_write_ha_state()
+            async_queue_command(self.hass, self._dev_eui, self._field, True, self._f_port, self._confirmed)
         else:
             self._pending_state = True
-        # TODO: Send downlink via MQTT
 
     async def async_turn_off(self, **kwargs):
         if self.hass is not None:
             self._is_on = False
             self.async_write_ha_state()
+            async_queue_command(self.hass, self._dev_eui, self._field, False, self._f_port, self._confirmed)
         else:
             self._pending_state = False
-        # TODO: Send downlink via MQTT
 
     async def async_added_to_hass(self):
         if self._pending_state is not None:
             self._is_on = self._pending_state
             self.async_write_ha_state()
-            self._pending_state = None 
+            self._pending_state = None
+            return
+        await async_restore_last_state(self, self._set_restored)
+
+    def _set_restored(self, state):
+        if state not in (STATE_ON, STATE_OFF):
+            raise ValueError(state)
+        self._is_on = state == STATE_ON
 
     @property
     def device_class(self):
@@ -0,0 +1,20 @@
+# Duplicated in custom_components/chirpstack_ha/decoder.py: the integration is installed on its own and the bridge
+# runs without Home Assistant, so neither can import the other's copy. Keep both identical.
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib decoder
+    orjson = None
+
+
+def loads(data):
+    """Decode JSON from bytes or str with orjson when installed, else the stdlib."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def decode_uplink(payload):
+    """Decode a ChirpStack uplink event payload (bytes or str)."""
+    return loads(payload)
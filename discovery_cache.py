@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_FLUSH_INTERVAL = 60
+
+
+def discovery_digest(*parts):
+    """Fixed-size digest of everything that goes into a device's discovery configs."""
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return hashlib.blake2b(canonical, digest_size=16).digest()
+
+
+class DiscoveryCache:
+    """Digest of the last published discovery config per devEui, persisted in SQLite.
+
+    Digests are written through as soon as they change; last-seen times are
+    kept in memory and flushed periodically, when devices that have not been
+    seen for `ttl` seconds are evicted. The cache is reloaded at startup so a
+    restart does not republish every retained discovery config.
+
+    With shared=True several bridge processes use the same file: digests are
+    read from the database rather than memory, and claim() is an atomic
+    compare-and-set so exactly one process publishes each change.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, flush_interval=DEFAULT_FLUSH_INTERVAL, shared=False):
+        self._ttl = ttl
+        self._flush_interval = flush_interval
+        self._shared = shared
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS discovery ("
+            "dev_eui TEXT PRIMARY KEY, digest BLOB NOT NULL, last_seen REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._digests = {}
+        self._last_seen = {}
+        self._seen = set()
+        self._last_flush = time.time()
+        self.evict_expired()
+        for dev_eui, digest, last_seen in self._conn.execute("SELECT dev_eui, digest, last_seen FROM discovery"):
+            self._digests[dev_eui] = bytes(digest)
+            self._last_seen[dev_eui] = last_seen
+        logging.info(f"Loaded {len(self._digests)} devices from discovery cache {path}")
+
+    def __len__(self):
+        return len(self._digests)
+
+    def get(self, dev_eui):
+        if self._shared:
+            with self._lock:
+                return self._read_digest(dev_eui)
+        return self._digests.get(dev_eui)
+
+    def _read_digest(self, dev_eui):
+        row = self._conn.execute("SELECT digest FROM discovery WHERE dev_eui = ?", (dev_eui,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def is_current(self, dev_eui, digest):
+        """Record that the device was seen and report whether its digest is unchanged."""
+        now = time.time()
+        with self._lock:
+            self._last_seen[dev_eui] = now
+            self._seen.add(dev_eui)
+            if self._shared:
+                current = self._read_digest(dev_eui) == digest
+            else:
+                current = self._digests.get(dev_eui) == digest
+        if now - self._last_flush >= self._flush_interval:
+            self.flush()
+        return current
+
+    def store(self, dev_eui, digest):
+        now = time.time()
+        with self._lock:
+            self._digests[dev_eui] = digest
+            self._last_seen[dev_eui] = now
+            self._seen.discard(dev_eui)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO discovery (dev_eui, digest, last_seen) VALUES (?, ?, ?)",
+                (dev_eui, digest, now),
+            )
+            self._conn.commit()
+
+    def claim(self, dev_eui, digest):
+        """Store the digest unless it is already current; return True if this call changed it.
+
+        The conditional upsert runs under SQLite's write lock, so when several
+        processes race on the same change only one of them gets True.
+        """
+        now = time.time()
+        with self._lock:
+            if not self._shared and self._digests.get(dev_eui) == digest:
+                return False
+            cursor = self._conn.execute(
+                "INSERT INTO discovery (dev_eui, digest, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(dev_eui) DO UPDATE SET digest = excluded.digest, last_seen = excluded.last_seen "
+                "WHERE discovery.digest != excluded.digest",
+                (dev_eui, digest, now),
+            )
+            self._conn.commit()
+            self._digests[dev_eui] = digest
+            self._last_seen[dev_eui] = now
+            self._seen.discard(dev_eui)
+            return cursor.rowcount > 0
+
+    def release(self, dev_eui, digest):
+        """Undo a claim whose configs could not be published, unless the digest changed since.
+
+        The device is forgotten rather than restored to its previous digest,
+        so its next uplink publishes the configs again.
+        """
+        with self._lock:
+            if self._digests.get(dev_eui) == digest:
+                del self._digests[dev_eui]
+            self._conn.execute("DELETE FROM discovery WHERE dev_eui = ? AND digest = ?", (dev_eui, digest))
+            self._conn.commit()
+
+    def flush(self):
+        """Persist last-seen times and evict devices not seen for the TTL."""
+        with self._lock:
+            seen, self._seen = self._seen, set()
+            self._last_flush = time.time()
+            self._conn.executemany(
+                "UPDATE discovery SET last_seen = ? WHERE dev_eui = ?",
+                [(self._last_seen[dev_eui], dev_eui) for dev_eui in seen if self._shared or dev_eui in self._digests],
+            )
+            self._conn.commit()
+        self.evict_expired()
+
+    def evict_expired(self):
+        cutoff = time.time() - self._ttl
+        with self._lock:
+            expired = [dev_eui for dev_eui, last_seen in self._last_seen.items() if last_seen < cutoff]
+            for dev_eui in expired:
+                self._digests.pop(dev_eui, None)
+                self._last_seen.pop(dev_eui, None)
+            self._conn.execute("DELETE FROM discovery WHERE last_seen < ?", (cutoff,))
+            self._conn.commit()
+        if expired:
+            logging.info(f"Evicted {len(expired)} devices not seen for {self._ttl}s from discovery cache")
+
+    def close(self):
+        self.flush()
+        self._conn.close()
@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "chirpstack_bridge"
+
+COUNTER_HELP = {
+    "messages": "Uplink messages received",
+    "errors": "Uplink messages that failed processing",
+    "discovery_changes": "Devices whose discovery configs were (re)published",
+    "discovery_published": "Discovery config messages published",
+    "publish_errors": "Discovery config messages the MQTT client did not accept",
+}
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        # One count per bucket, plus one for values above the last bound
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+
+class Metrics:
+    """Counters and per-stage latency histograms for the bridge.
+
+    Updates take an uncontended lock and a few additions, since the pipelined
+    mode records from worker threads; the text exposition is only rendered
+    when the endpoint is scraped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(COUNTER_HELP, 0)
+        self.stages = {}
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, stage, seconds):
+        index = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.counts[index] += 1
+            histogram.count += 1
+            histogram.total += seconds
+
+    def render_prometheus(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            counters = dict(self.counters)
+            stages = {stage: (list(h.counts), h.count, h.total) for stage, h in self.stages.items()}
+        lines = []
+        for name, value in sorted(counters.items()):
+            metric = f"{PREFIX}_{name}_total"
+            lines.append(f"# HELP {metric} {COUNTER_HELP.get(name, name)}")
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        metric = f"{PREFIX}_stage_seconds"
+        lines.append(f"# HELP {metric} Time spent per message in each bridge stage")
+        lines.append(f"# TYPE {metric} histogram")
+        for stage, (counts, count, total) in sorted(stages.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class Timer:
+    """Context manager observing the duration of a block as a stage."""
+
+    __slots__ = ("_metrics", "_stage", "_start")
+
+    def __init__(self, metrics, stage):
+        self._metrics = metrics
+        self._stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._metrics.observe(self._stage, time.perf_counter() - self._start)
+
+
+def start_metrics_server(metrics, port, host=""):
+    """Serve GET /metrics from a daemon thread; returns the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug("Metrics endpoint: " + format, *args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Serving Prometheus metrics on port {server.server_address[1]}")
+    return server
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from sharding import uplink_subscription
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_IN_FLIGHT = 256
+DEFAULT_PUBLISH_BATCH = 100
+
+
+class TopicAliases:
+    """MQTT v5 topic aliases for repetitive publish topics.
+
+    Aliases are only valid for one connection and are limited by the
+    broker's Topic Alias Maximum; the least recently used alias is reused
+    when they run out.
+    """
+
+    def __init__(self, maximum=0):
+        self.maximum = maximum
+        self._aliases = OrderedDict()
+
+    def reset(self, maximum):
+        self.maximum = maximum
+        self._aliases.clear()
+
+    def lookup(self, topic):
+        """Return (topic to send, alias or None) for a publish."""
+        alias = self._aliases.get(topic)
+        if alias is not None:
+            self._aliases.move_to_end(topic)
+            return "", alias
+        if not self.maximum:
+            return topic, None
+        if len(self._aliases) < self.maximum:
+            alias = len(self._aliases) + 1
+        else:
+            _, alias = self._aliases.popitem(last=False)
+        # Sending the topic together with the alias (re)binds the alias
+        self._aliases[topic] = alias
+        return topic, alias
+
+    def forget(self, topic):
+        """Drop a topic's alias, whose binding may not have reached the broker."""
+        self._aliases.pop(topic, None)
+
+
+class PipelinedBridge:
+    """Three-stage asyncio bridge: receive, decode/diff on a worker pool, batched publish.
+
+    `process(topic, payload)` runs on the worker pool and may run for several
+    messages at once; `finish(result)` runs on the event loop in arrival order
+    and returns the (topic, payload) messages to publish. If the client does
+    not accept one of them, `release(result)` is called to undo what `finish`
+    recorded, so a later uplink publishes them again. Messages are received
+    with QoS 1 and acknowledged, in order, only once their publishes were
+    handed to the client, so the MQTT v5 Receive Maximum bounds how many are
+    in flight; the receive stage also blocks paho's network thread while the
+    pipeline is full.
+    """
+
+    def __init__(self, cfg, process, finish, release=None, workers=None, max_in_flight=None, publish_batch=None, metrics=None):
+        self._cfg = cfg
+        self._metrics = metrics
+        self._process = process
+        self._finish = finish
+        self._release = release
+        self._workers = workers or getattr(cfg, "PIPELINE_WORKERS", DEFAULT_WORKERS)
+        self._max_in_flight = max_in_flight or getattr(cfg, "PIPELINE_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT)
+        self._publish_batch = publish_batch or getattr(cfg, "PIPELINE_PUBLISH_BATCH", DEFAULT_PUBLISH_BATCH)
+        self._aliases = TopicAliases()
+        self._loop = None
+        self._client = None
+        self._pending = None
+        self._outgoing = None
+        self._executor = None
+        self._publisher = None
+
+    def run(self):
+        asyncio.run(self._async_main())
+
+    def create_client(self):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, protocol=mqtt.MQTTv5, manual_ack=True)
+        if self._cfg.MQTT_USERNAME:
+            client.username_pw_set(self._cfg.MQTT_USERNAME, self._cfg.MQTT_PASSWORD)
+        client.on_connect = self._on_connect
+        client.on_message = self._on_message
+        return client
+
+    def subscription_topic(self):
+        return uplink_subscription(self._cfg)
+
+    async def _async_main(self):
+        self._loop = asyncio.get_running_loop()
+        self._pending = asyncio.Queue(maxsize=self._max_in_flight)
+        self._outgoing = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="bridge-worker")
+        # A single publisher thread keeps publishes (and alias bindings) in order
+        self._publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bridge-publish")
+        self._client = self.create_client()
+        properties = Properties(PacketTypes.CONNECT)
+        properties.ReceiveMaximum = self._max_in_flight
+        self._client.connect(self._cfg.MQTT_BROKER_HOST, self._cfg.MQTT_BROKER_PORT, properties=properties)
+        self._client.loop_start()
+        try:
+            await asyncio.gather(self._async_ordered_stage(), self._async_publish_stage())
+        finally:
+            self._client.loop_stop()
+            self._executor.shutdown(wait=True)
+            self._publisher.shutdown(wait=True)
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        logging.info(f"Connected to MQTT broker (pipelined mode, reason: {reason_code})")
+        maximum = getattr(properties, "TopicAliasMaximum", 0) if properties is not None else 0
+        self._loop.call_soon_threadsafe(self._aliases.reset, maximum)
+        client.subscribe(self.subscription_topic(), qos=1)
+
+    def _on_message(self, client, userdata, msg):
+        # Runs on paho's network thread: block it until the pipeline has room
+        asyncio.run_coroutine_threadsafe(self._async_receive(msg), self._loop).result()
+
+    async def _async_receive(self, msg):
+        work = self._loop.run_in_executor(self._executor, self._process, msg.topic, msg.payload)
+        await self._pending.put((msg, work))
+
+    async def _async_ordered_stage(self):
+        while True:
+            msg, work = await self._pending.get()
+            result, messages = None, []
+            try:
+                result = await work
+                messages = self._finish(result)
+            except Exception:
+                if self._metrics is not None:
+                    self._metrics.inc("errors")
+                logging.exception("Error processing message")
+            # Acknowledged by the publish stage once its messages are handed to the client
+            self._outgoing.put_nowait((msg, result, messages))
+
+    async def _async_publish_stage(self):
+        while True:
+            batch = [await self._outgoing.get()]
+            count = len(batch[0][2])
+            while count < self._publish_batch and not self._outgoing.empty():
+                batch.append(self._outgoing.get_nowait())
+                count += len(batch[-1][2])
+            failed = [()] * len(batch)
+            if count:
+                # Aliases are assigned here, in publish order, before handing off the batch
+                publishes = [[(*self._aliases.lookup(topic), topic, payload) for topic, payload in messages] for _, _, messages in batch]
+                failed = await self._loop.run_in_executor(self._publisher, self._publish, publishes)
+            for (msg, result, _), failed_topics in zip(batch, failed):
+                if failed_topics:
+                    for topic in failed_topics:
+                        self._aliases.forget(topic)
+                    if self._release is not None:
+                        self._release(result)
+                if msg.qos > 0:
+                    self._client.ack(msg.mid, msg.qos)
+
+    def _publish(self, publishes):
+        """Publish each message's configs; return the topics the client did not accept, per message."""
+        start = time.perf_counter()
+        failed = []
+        published = 0
+        for messages in publishes:
+            failed_topics = []
+            for send_topic, alias, topic, payload in messages:
+                properties = None
+                if alias is not None:
+                    properties = Properties(PacketTypes.PUBLISH)
+                    properties.TopicAlias = alias
+                info = self._client.publish(send_topic, payload, qos=0, retain=True, properties=properties)
+                if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                    published += 1
+                else:
+                    failed_topics.append(topic)
+            failed.append(failed_topics)
+        errors = sum(map(len, failed))
+        if self._metrics is not None:
+            self._metrics.observe("publish", time.perf_counter() - start)
+            self._metrics.inc("discovery_published", published)
+            if errors:
+                self._metrics.inc("publish_errors", errors)
+        if errors:
+            logging.warning(f"Failed to publish {errors} HA discovery messages; their devices publish again on the next uplink")
+        logging.info(f"Published {published} HA discovery messages")
+        return failed
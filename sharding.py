@@ -0,0 +1,21 @@
+def shared_topic(topic, group):
+    """Topic filter for an MQTT shared subscription in `group`, or the plain topic."""
+    if not group:
+        return topic
+    return f"$share/{group}/{topic}"
+
+
+def uplink_subscription(cfg):
+    return shared_topic(cfg.CHIRPSTACK_UPLINK_TOPIC, getattr(cfg, "SHARE_GROUP", None))
+
+
+def shares_discovery_cache(cfg):
+    """Whether this instance coordinates discovery with others through a shared cache file.
+
+    Instances in a share group may each receive any device's uplinks, so
+    they read digests from the cache file rather than memory and claim each
+    change there; exactly one of them publishes it. A change racing an older
+    uplink on another instance can briefly republish the old config until
+    the device's next uplink.
+    """
+    return bool(getattr(cfg, "SHARE_GROUP", None))
@@ -0,0 +1,166 @@
+import json
+import logging
+import re
+from collections import OrderedDict
+
+DEFAULT_MAX_SPECS = 1024
+
+# Per-device values are spliced into compiled templates at these sentinels
+DEV_EUI = "\x00dev_eui\x00"
+DEVICE_NAME = "\x00device_name\x00"
+STATE_TOPIC = "\x00state_topic\x00"
+APPLICATION_ID = "\x00application_id\x00"
+PLACEHOLDERS = (DEV_EUI, DEVICE_NAME, STATE_TOPIC, APPLICATION_ID)
+
+
+def _escape(value):
+    """JSON string contents (without the quotes) for a value."""
+    return json.dumps(str(value))[1:-1]
+
+
+# Sentinels as they appear in topics and, escaped, inside serialized JSON payloads
+_RAW = {placeholder: placeholder for placeholder in PLACEHOLDERS}
+_ESCAPED = {_escape(placeholder).encode(): placeholder for placeholder in PLACEHOLDERS}
+_RAW_PATTERN = re.compile("|".join(map(re.escape, _RAW)))
+_ESCAPED_PATTERN = re.compile(b"|".join(map(re.escape, _ESCAPED)))
+
+
+class Template:
+    """Text split once into literal fragments around placeholder slots."""
+
+    __slots__ = ("fragments", "slots")
+
+    def __init__(self, text, pattern, table):
+        self.fragments = []
+        self.slots = []
+        pos = 0
+        for match in pattern.finditer(text):
+            self.fragments.append(text[pos:match.start()])
+            self.slots.append(table[match.group()])
+            pos = match.end()
+        self.fragments.append(text[pos:])
+
+    def render(self, values):
+        fragments = self.fragments
+        parts = [fragments[0]]
+        for slot, fragment in zip(self.slots, fragments[1:]):
+            parts.append(values[slot])
+            parts.append(fragment)
+        return fragments[0][:0].join(parts)
+
+
+def discovery_payloads(discovery_prefix, dev_eui, ha_device_name, application_id, discovery, downlinks, chirpstack_topic):
+    """Yield the (topic, payload dict) HA discovery configs for a device."""
+    # Sensors
+    for sensor in discovery:
+        unique_id = f"{dev_eui}_{sensor['field']}"
+        topic = f"{discovery_prefix}/sensor/{unique_id}/config"
+        payload = {
+            "name": sensor.get("name", sensor["field"]),
+            # Use ChirpStack uplink event topic as state_topic
+            "state_topic": chirpstack_topic,
+            # Value template extracts from value_json.object.<field>
+            "value_template": f"{{{{ value_json.object.{sensor['field']} }}}}",
+            "unit_of_measurement": sensor.get("unit"),
+            "unique_id": unique_id,
+            "device_class": sensor.get("device_class"),
+            # Use <application name>-<device name> for grouping in HA
+            "device": {
+                "identifiers": [dev_eui],
+                "name": ha_device_name
+            }
+        }
+        # If the sensor specifies a display precision, include it
+        if "precision" in sensor:
+            payload["suggested_display_precision"] = sensor["precision"]
+        # Remove None values
+        yield topic, {k: v for k, v in payload.items() if v is not None}
+    # Downlink controls
+    for dl in downlinks:
+        unique_id = f"{dev_eui}_{dl['field']}"
+        command_topic = f"application/{application_id}/device/{dev_eui}/command/down"
+        base_payload = {
+            "name": dl.get("name", dl["field"]),
+            "command_topic": command_topic,
+            "unique_id": unique_id,
+            "device": {
+                "identifiers": [dev_eui],
+                "name": ha_device_name
+            }
+        }
+        # If the command specifies enabled_by_default, include it
+        if "enabled_by_default" in dl:
+            base_payload["enabled_by_default"] = dl["enabled_by_default"]
+        entity_type = dl["type"]
+        if entity_type == "button":
+            payload = base_payload.copy()
+            payload["payload_press"] = json.dumps({dl["field"]: True})
+            topic = f"{discovery_prefix}/button/{unique_id}/config"
+        elif entity_type == "number":
+            payload = base_payload.copy()
+            payload["min"] = dl.get("min", 0)
+            payload["max"] = dl.get("max", 255)
+            payload["step"] = dl.get("step", 1)
+            payload["unit_of_measurement"] = dl.get("unit")
+            payload["mode"] = "box"
+            payload["command_template"] = json.dumps({dl["field"]: "{{ value }}"})
+            topic = f"{discovery_prefix}/number/{unique_id}/config"
+        elif entity_type == "select":
+            payload = base_payload.copy()
+            payload["options"] = dl.get("options", [])
+            payload["command_template"] = json.dumps({dl["field"]: "{{ value }}"})
+            topic = f"{discovery_prefix}/select/{unique_id}/config"
+        elif entity_type == "switch":
+            payload = base_payload.copy()
+            payload["payload_on"] = json.dumps({dl["field"]: True})
+            payload["payload_off"] = json.dumps({dl["field"]: False})
+            topic = f"{discovery_prefix}/switch/{unique_id}/config"
+        elif entity_type == "text":
+            payload = base_payload.copy()
+            payload["command_template"] = json.dumps({dl["field"]: "{{ value }}"})
+            payload["max"] = dl.get("max", 255)
+            topic = f"{discovery_prefix}/text/{unique_id}/config"
+        else:
+            logging.warning(f"Unknown downlink type: {entity_type}")
+            continue
+        yield topic, {k: v for k, v in payload.items() if v is not None}
+
+
+class DiscoveryTemplates:
+    """Discovery configs compiled once per device spec, rendered by splicing per-device values.
+
+    A device spec (its discovery sensors and commands) is built and
+    serialized once with sentinels in place of the devEui, device name,
+    application ID and state topic. Rendering another device with the same
+    spec, or republishing a device, only joins pre-serialized fragments.
+    Compiled specs are kept in an LRU of `max_specs` entries.
+    """
+
+    def __init__(self, discovery_prefix, max_specs=DEFAULT_MAX_SPECS):
+        self.discovery_prefix = discovery_prefix
+        self.max_specs = max_specs
+        self._compiled = OrderedDict()
+
+    def __len__(self):
+        return len(self._compiled)
+
+    def compile(self, discovery, downlinks):
+        key = json.dumps((discovery, downlinks), sort_keys=True, separators=(",", ":"), default=str)
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            self._compiled.move_to_end(key)
+            return compiled
+        compiled = [
+            (Template(topic, _RAW_PATTERN, _RAW), Template(json.dumps(payload).encode(), _ESCAPED_PATTERN, _ESCAPED))
+            for topic, payload in discovery_payloads(self.discovery_prefix, DEV_EUI, DEVICE_NAME, APPLICATION_ID, discovery, downlinks, STATE_TOPIC)
+        ]
+        self._compiled[key] = compiled
+        if len(self._compiled) > self.max_specs:
+            self._compiled.popitem(last=False)
+        return compiled
+
+    def render(self, dev_eui, ha_device_name, application_id, discovery, downlinks, chirpstack_topic):
+        """Return the (topic, payload bytes) retained discovery configs for a device."""
+        raw = {DEV_EUI: str(dev_eui), DEVICE_NAME: str(ha_device_name), APPLICATION_ID: str(application_id), STATE_TOPIC: str(chirpstack_topic)}
+        escaped = {placeholder: _escape(value).encode() for placeholder, value in raw.items()}
+        return [(topic.render(raw), payload.render(escaped)) for topic, payload in self.compile(discovery, downlinks)]
@@ -0,0 +1,503 @@
+"""Run several sharded bridge instances against a local stand-in broker.
+
+The broker implements just enough MQTT 3.1.1 and 5 for the bridge: CONNECT,
+SUBSCRIBE with $share/<group>/ round-robin delivery, QoS 0/1 PUBLISH and
+PUBACK, MQTT 5 topic aliases from clients, retained messages and PINGREQ.
+It does not enforce Receive Maximum. The harness publishes uplinks for a
+fleet with QoS 1, changes the discovery block of some devices halfway
+through, and checks that each discovery config was published exactly once
+per change. With --mode pipelined it also checks that every uplink delivered
+to a bridge was acknowledged and that the bridges published through topic
+aliases without binding errors.
+
+    python tools/shard_harness.py
+    python tools/shard_harness.py --instances 2 3 --mode pipelined --topic-alias-maximum 16
+    python tools/shard_harness.py --broker-only --port 1883
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+from collections import Counter, defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPLINK_TOPIC = "application/+/device/+/event/up"
+SHARE_GROUP = "chirpstack_bridge"
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+TOPIC_ALIAS_MAXIMUM, TOPIC_ALIAS = 0x22, 0x23
+# Value sizes of MQTT 5 properties by identifier: fixed byte counts, or
+# "varint", "str" (also binary data) and "pair" (a string pair)
+PROPERTY_SIZES = {
+    0x01: 1, 0x02: 4, 0x03: "str", 0x08: "str", 0x09: "str", 0x0B: "varint", 0x11: 4, 0x12: "str",
+    0x13: 2, 0x15: "str", 0x16: "str", 0x17: 1, 0x18: 4, 0x19: 1, 0x1A: "str", 0x1C: "str", 0x1F: "str",
+    0x21: 2, 0x22: 2, 0x23: 2, 0x24: 1, 0x25: 1, 0x26: "pair", 0x27: 4, 0x28: 1, 0x29: 1, 0x2A: 1,
+}
+
+
+def encode_str(value):
+    data = value.encode()
+    return len(data).to_bytes(2, "big") + data
+
+
+def decode_str(body, pos):
+    length = int.from_bytes(body[pos:pos + 2], "big")
+    return body[pos + 2:pos + 2 + length].decode(), pos + 2 + length
+
+
+def encode_varint(value):
+    data = bytearray()
+    while True:
+        byte = value % 128
+        value //= 128
+        data.append(byte | 0x80 if value else byte)
+        if not value:
+            return bytes(data)
+
+
+def decode_varint(body, pos):
+    multiplier, value = 1, 0
+    while True:
+        byte = body[pos]
+        pos += 1
+        value += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            return value, pos
+        multiplier *= 128
+
+
+def encode_packet(first, body=b""):
+    return bytes([first]) + encode_varint(len(body)) + body
+
+
+def decode_properties(body, pos):
+    """Return ({identifier: value}, position after) for MQTT 5 properties at pos."""
+    length, pos = decode_varint(body, pos)
+    end = pos + length
+    properties = {}
+    while pos < end:
+        identifier = body[pos]
+        size = PROPERTY_SIZES[identifier]
+        pos += 1
+        if size == "varint":
+            value, pos = decode_varint(body, pos)
+        elif size == "str":
+            length = int.from_bytes(body[pos:pos + 2], "big")
+            value, pos = body[pos + 2:pos + 2 + length], pos + 2 + length
+        elif size == "pair":
+            key, pos = decode_str(body, pos)
+            value, pos = decode_str(body, pos)
+            value = (key, value)
+        else:
+            value, pos = int.from_bytes(body[pos:pos + size], "big"), pos + size
+        properties[identifier] = value
+    return properties, end
+
+
+async def read_packet(reader):
+    first = (await reader.readexactly(1))[0]
+    multiplier, length = 1, 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            break
+        multiplier *= 128
+    return first, await reader.readexactly(length)
+
+
+def encode_publish(topic, payload, qos=0, retain=False, packet_id=1, version=4):
+    body = encode_str(topic)
+    if qos:
+        body += packet_id.to_bytes(2, "big")
+    if version == 5:
+        body += b"\x00"  # No properties
+    return encode_packet(PUBLISH << 4 | qos << 1 | int(retain), body + payload)
+
+
+def topic_matches(topic_filter, topic):
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels) or (level != "+" and level != topic_levels[i]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class Session:
+    def __init__(self, writer):
+        self.writer = writer
+        self.client_id = None
+        self.version = 4
+        # Highest QoS granted to the session's subscriptions
+        self.qos = 0
+        self.received = 0
+        self.acked = 0
+        self._next_packet_id = 0
+        self.unacked = set()
+        # Topic aliases bound by the client's publishes
+        self.aliases = {}
+        self.alias_bindings = 0
+        self.alias_publishes = 0
+
+    def send(self, data):
+        self.writer.write(data)
+
+    def deliver(self, topic, payload, qos=0, retain=False):
+        qos = min(qos, self.qos)
+        packet_id = 1
+        if qos:
+            self._next_packet_id = self._next_packet_id % 65535 + 1
+            packet_id = self._next_packet_id
+            self.unacked.add(packet_id)
+        self.send(encode_publish(topic, payload, qos, retain, packet_id, self.version))
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class StandInBroker:
+    """Single-process MQTT 3.1.1/5 broker with shared subscriptions, for tests only."""
+
+    def __init__(self, topic_alias_maximum=0):
+        self._server = None
+        self._subscriptions = defaultdict(set)  # filter -> sessions
+        self._groups = defaultdict(list)  # (group, filter) -> sessions, delivered round-robin
+        self._next_member = Counter()
+        self._retained = {}
+        self.topic_alias_maximum = topic_alias_maximum
+        self.errors = []
+        self.port = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def group_members(self, group):
+        return [s for (g, _), members in self._groups.items() if g == group for s in members]
+
+    async def _handle(self, reader, writer):
+        session = Session(writer)
+        try:
+            while True:
+                first, body = await read_packet(reader)
+                kind = first >> 4
+                if kind == CONNECT:
+                    self._connect(session, body)
+                elif kind == SUBSCRIBE:
+                    self._subscribe(session, body)
+                elif kind == UNSUBSCRIBE:
+                    self._unsubscribe(session, body)
+                elif kind == PUBLISH:
+                    self._publish(session, first, body)
+                elif kind == PUBACK:
+                    session.unacked.discard(int.from_bytes(body[:2], "big"))
+                    session.acked += 1
+                elif kind == PINGREQ:
+                    session.send(encode_packet(PINGRESP << 4))
+                elif kind == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Clients going away and the harness shutting down are both expected
+            pass
+        except ProtocolError as e:
+            self.errors.append(f"{session.client_id}: {e}")
+        finally:
+            self._drop(session)
+            writer.close()
+
+    def _connect(self, session, body):
+        # Protocol name, level, flags and keep alive precede the (MQTT 5) properties and client id
+        _, pos = decode_str(body, 0)
+        session.version = body[pos]
+        pos += 4
+        properties = b""
+        if session.version == 5:
+            _, pos = decode_properties(body, pos)
+            if self.topic_alias_maximum:
+                properties = bytes([TOPIC_ALIAS_MAXIMUM]) + self.topic_alias_maximum.to_bytes(2, "big")
+            properties = encode_varint(len(properties)) + properties
+        session.client_id, _ = decode_str(body, pos)
+        session.send(encode_packet(CONNACK << 4, b"\x00\x00" + properties))
+
+    def _subscribe(self, session, body):
+        packet_id, pos, granted = body[:2], 2, bytearray()
+        if session.version == 5:
+            _, pos = decode_properties(body, pos)
+        while pos < len(body):
+            topic_filter, pos = decode_str(body, pos)
+            qos = min(body[pos] & 3, 1)
+            pos += 1
+            granted.append(qos)
+            session.qos = max(session.qos, qos)
+            if topic_filter.startswith("$share/"):
+                _, group, shared_filter = topic_filter.split("/", 2)
+                self._groups[(group, shared_filter)].append(session)
+            else:
+                self._subscriptions[topic_filter].add(session)
+                for topic, payload in self._retained.items():
+                    if topic_matches(topic_filter, topic):
+                        session.deliver(topic, payload, retain=True)
+        properties = b"\x00" if session.version == 5 else b""
+        session.send(encode_packet(SUBACK << 4, packet_id + properties + bytes(granted)))
+
+    def _unsubscribe(self, session, body):
+        if session.version != 5:
+            session.send(encode_packet(UNSUBACK << 4, body[:2]))
+            return
+        _, pos = decode_properties(body, 2)
+        codes = bytearray()
+        while pos < len(body):
+            _, pos = decode_str(body, pos)
+            codes.append(0)
+        session.send(encode_packet(UNSUBACK << 4, body[:2] + b"\x00" + bytes(codes)))
+
+    def _publish(self, session, first, body):
+        qos = (first >> 1) & 3
+        topic, pos = decode_str(body, 0)
+        if qos:
+            session.send(encode_packet(PUBACK << 4, body[pos:pos + 2]))
+            pos += 2
+        if session.version == 5:
+            properties, pos = decode_properties(body, pos)
+            topic = self._resolve_alias(session, topic, properties.get(TOPIC_ALIAS))
+        payload = body[pos:]
+        if first & 1:
+            self._retained[topic] = payload
+        for topic_filter, sessions in self._subscriptions.items():
+            if topic_matches(topic_filter, topic):
+                for subscriber in sessions:
+                    subscriber.received += 1
+                    subscriber.deliver(topic, payload, qos)
+        for (group, topic_filter), members in self._groups.items():
+            if members and topic_matches(topic_filter, topic):
+                index = self._next_member[(group, topic_filter)] % len(members)
+                self._next_member[(group, topic_filter)] += 1
+                members[index].received += 1
+                members[index].deliver(topic, payload, qos)
+
+    def _resolve_alias(self, session, topic, alias):
+        if alias is None:
+            return topic
+        if not 0 < alias <= self.topic_alias_maximum:
+            raise ProtocolError(f"topic alias {alias} outside 1..{self.topic_alias_maximum}")
+        if topic:
+            session.aliases[alias] = topic
+            session.alias_bindings += 1
+            return topic
+        if alias not in session.aliases:
+            raise ProtocolError(f"topic alias {alias} used before it was bound")
+        session.alias_publishes += 1
+        return session.aliases[alias]
+
+    def _drop(self, session):
+        for sessions in self._subscriptions.values():
+            sessions.discard(session)
+        for members in self._groups.values():
+            if session in members:
+                members.remove(session)
+
+
+class HarnessClient:
+    """Minimal MQTT 3.1.1 client for publishing uplinks and collecting discovery configs (QoS 0)."""
+
+    def __init__(self):
+        self.messages = []
+        self._reader = None
+        self._writer = None
+        self._task = None
+        self._next_packet_id = 0
+
+    async def connect(self, port, client_id):
+        self._reader, self._writer = await asyncio.open_connection("127.0.0.1", port)
+        body = encode_str("MQTT") + bytes([4, 2]) + (60).to_bytes(2, "big") + encode_str(client_id)
+        self._writer.write(encode_packet(CONNECT << 4, body))
+        await read_packet(self._reader)
+        self._task = asyncio.create_task(self._read_loop())
+
+    async def subscribe(self, topic_filter):
+        self._writer.write(encode_packet(SUBSCRIBE << 4 | 2, b"\x00\x01" + encode_str(topic_filter) + b"\x00"))
+        await self._writer.drain()
+
+    async def publish(self, topic, payload, qos=0):
+        self._next_packet_id = self._next_packet_id % 65535 + 1
+        self._writer.write(encode_publish(topic, payload, qos, packet_id=self._next_packet_id))
+        await self._writer.drain()
+
+    async def _read_loop(self):
+        try:
+            while True:
+                first, body = await read_packet(self._reader)
+                if first >> 4 == PUBLISH:
+                    topic, pos = decode_str(body, 0)
+                    self.messages.append((topic, body[pos:]))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    async def close(self):
+        if self._writer is None:
+            return
+        self._writer.write(encode_packet(DISCONNECT << 4))
+        self._writer.close()
+        self._task.cancel()
+
+
+def uplink(dev_eui, revision, f_cnt):
+    sensors = [
+        {"field": "temperature", "name": f"Temperature r{revision}", "unit": "°C", "device_class": "temperature"},
+        {"field": "humidity", "unit": "%", "device_class": "humidity"},
+    ]
+    event = {
+        "deviceInfo": {"devEui": dev_eui, "deviceName": f"dev-{dev_eui}", "applicationId": "1", "applicationName": "harness"},
+        "fCnt": f_cnt,
+        "object": {"temperature": 20 + f_cnt % 5, "humidity": 50, "discovery": {"sensors": sensors}},
+    }
+    return f"application/1/device/{dev_eui}/event/up", json.dumps(event).encode()
+
+
+def write_config(directory, port, args):
+    with open(os.path.join(directory, "config.py"), "w") as f:
+        f.write(textwrap.dedent(f"""\
+            import os
+            from types import SimpleNamespace
+
+            def get_config():
+                return SimpleNamespace(
+                    LOG_LEVEL="WARNING",
+                    MQTT_BROKER_HOST="127.0.0.1",
+                    MQTT_BROKER_PORT={port},
+                    MQTT_USERNAME=None,
+                    MQTT_PASSWORD=None,
+                    CHIRPSTACK_UPLINK_TOPIC={UPLINK_TOPIC!r},
+                    HA_DISCOVERY_PREFIX="homeassistant",
+                    BRIDGE_MODE={args.mode!r},
+                    SHARE_GROUP={SHARE_GROUP!r},
+                    DISCOVERY_CACHE_PATH=os.environ["DISCOVERY_CACHE_PATH"],
+                )
+            """))
+
+
+async def wait_until(condition, timeout, interval=0.1):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            return False
+        await asyncio.sleep(interval)
+    return True
+
+
+async def run_harness(args, instances):
+    broker = StandInBroker(args.topic_alias_maximum)
+    await broker.start()
+    workdir = tempfile.mkdtemp(prefix="shard_harness_")
+    write_config(workdir, broker.port, args)
+    bridges = []
+    for _ in range(instances):
+        env = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join(filter(None, [workdir, os.environ.get("PYTHONPATH")])),
+            DISCOVERY_CACHE_PATH=os.path.join(workdir, "cache.sqlite3"),
+        )
+        bridges.append(subprocess.Popen([sys.executable, os.path.join(ROOT, "main.py")], cwd=workdir, env=env))
+    listener = HarnessClient()
+    publisher = HarnessClient()
+    try:
+        if not await wait_until(lambda: len(broker.group_members(SHARE_GROUP)) == instances, 15):
+            print("Bridges did not all subscribe to the shared group", file=sys.stderr)
+            return 1
+        await listener.connect(broker.port, "harness-listener")
+        await listener.subscribe("homeassistant/#")
+        await publisher.connect(broker.port, "harness-publisher")
+        devices = [f"{i:016x}" for i in range(args.devices)]
+        changed = set(devices[::2])
+        for round_number in range(args.rounds):
+            for dev_eui in devices:
+                revision = 1 if dev_eui in changed and round_number >= args.rounds // 2 else 0
+                await publisher.publish(*uplink(dev_eui, revision, round_number), qos=1)
+            # Let a round settle so a change does not race older uplinks across instances
+            await asyncio.sleep(args.round_delay)
+        await asyncio.sleep(args.settle)
+        members = broker.group_members(SHARE_GROUP)
+        if args.mode == "pipelined":
+            # Uplinks are only acknowledged once their discovery configs were handed to the client
+            await wait_until(lambda: all(not session.unacked for session in members), args.settle)
+        counts = Counter(topic for topic, _ in listener.messages)
+        failures = []
+        for dev_eui in devices:
+            expected = {
+                f"homeassistant/sensor/{dev_eui}_temperature/config": 2 if dev_eui in changed else 1,
+                # The humidity config text does not change, but the device digest does
+                f"homeassistant/sensor/{dev_eui}_humidity/config": 2 if dev_eui in changed else 1,
+            }
+            for topic, count in expected.items():
+                if counts[topic] != count:
+                    failures.append(f"{topic}: published {counts[topic]} times, expected {count}")
+        failures.extend(broker.errors)
+        if args.mode == "pipelined":
+            for session in members:
+                if session.unacked or session.acked != session.received:
+                    failures.append(f"{session.client_id}: {session.acked} of {session.received} uplinks acknowledged")
+            if args.topic_alias_maximum and not any(session.alias_bindings for session in members):
+                failures.append("No discovery config was published with a topic alias")
+        deliveries = [session.received for session in members]
+        print(f"{instances} instances ({args.mode}), uplinks per instance: {deliveries}")
+        print(f"{len(listener.messages)} discovery configs published for {len(devices)} devices")
+        if args.mode == "pipelined":
+            print(f"topic aliases bound per instance: {[session.alias_bindings for session in members]}, used: {[session.alias_publishes for session in members]}")
+        for failure in failures:
+            print(f"FAIL {failure}", file=sys.stderr)
+        return 1 if failures else 0
+    finally:
+        for bridge in bridges:
+            bridge.terminate()
+        for bridge in bridges:
+            bridge.wait(timeout=10)
+        await publisher.close()
+        await listener.close()
+        await broker.stop()
+
+
+async def run_broker(port, topic_alias_maximum):
+    broker = StandInBroker(topic_alias_maximum)
+    await broker.start(port=port)
+    print(f"Stand-in broker listening on 127.0.0.1:{broker.port}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--instances", type=int, nargs="+", default=[2, 3], help="instance counts to run the harness with, one after another")
+    parser.add_argument("--mode", choices=("simple", "pipelined"), default="simple", help="bridge mode (BRIDGE_MODE)")
+    parser.add_argument("--topic-alias-maximum", type=int, default=16, help="topic aliases the broker accepts per MQTT 5 client")
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=6)
+    parser.add_argument("--round-delay", type=float, default=0.5)
+    parser.add_argument("--settle", type=float, default=2.0)
+    parser.add_argument("--broker-only", action="store_true", help="only run the stand-in broker")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+    if args.broker_only:
+        asyncio.run(run_broker(args.port, args.topic_alias_maximum))
+        return 0
+    failed = 0
+    for instances in args.instances:
+        failed |= asyncio.run(run_harness(args, instances))
+    return failed
+
+
+if __name__ == "__main__":
+    sys.exit(main())